@@ -1,6 +1,8 @@
 
 import os
 import io
+import asyncio
+import threading
 import torch
 import cv2
 import numpy as np
@@ -9,89 +11,160 @@ from fastapi.responses import JSONResponse
 import uvicorn
 
 from . import config
-from .model import DeepLabV3Plus
-from .utils import mask_to_geojson, fetch_satellite_tile, segment_roof_from_center, pixels_to_latlng
+from .model_registry import get_model, model_fingerprint, stats as model_stats
+from .batching import InferenceBatcher
+from .tiled_inference import iter_tile_batches, TileBlender, INFERENCE_MODES
+from .utils import mask_to_geojson
+from .pipeline import SegmentPipeline, PipelineError, SEGMENT_METHODS
+from .mask_codec import encode_mask, MASK_ENCODINGS
+from .result_cache import ResultCache, cache_path, image_digest
 
 app = FastAPI(title="Roof Segmentation API", version="1.0")
 # Trigger Reload
 
-# Load Model
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model = DeepLabV3Plus(n_classes=1, backbone=config.BACKBONE).to(device)
+# Model + micro-batching scheduler, created on first use (or at server startup),
+# not at import. The model comes from the registry shared with inference_engine.py.
+_batcher = None
+_batcher_lock = threading.Lock()
 
-if os.path.exists(config.BEST_MODEL_PATH):
-    model.load_state_dict(torch.load(config.BEST_MODEL_PATH, map_location=device))
-    print("Loaded best model.")
-else:
-    print("Warning: No checkpoint found. Using random weights.")
+def get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            model, device = get_model()
+            # Forward passes run on the batcher's worker thread, off the event loop
+            _batcher = InferenceBatcher(model, device, max_batch_size=config.BATCH_MAX_SIZE, max_wait_ms=config.BATCH_MAX_WAIT_MS)
+    return _batcher
 
-model.eval()
+# Set by serve.py in multi-worker mode: shared readiness flags and this worker's slot
+worker_readiness = None
+worker_index = 0
+
+@app.on_event("startup")
+async def load_model_on_startup():
+    await asyncio.to_thread(get_batcher)
+    if worker_readiness is not None:
+        worker_readiness[worker_index] = 1
+
+@app.get("/ready")
+async def ready():
+    is_ready = _batcher is not None
+    content = {"ready": is_ready, "pid": os.getpid()}
+    if worker_readiness is not None:
+        content["worker"] = worker_index
+        content["workers_ready"] = list(worker_readiness)
+    return JSONResponse(content=content, status_code=200 if is_ready else 503)
+
+async def predict_image(image, mode=config.INFERENCE_MODE):
+    """
+    Runs the model on an RGB uint8 image through the shared batcher.
+    Returns (mask, prob_map) at the image's resolution.
+    Used by /predict and by the model method of /segment.
+    """
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode '{mode}'. Options: {', '.join(INFERENCE_MODES)}")
+    original_size = image.shape[:2]
+    
+    batcher = get_batcher()
+    if mode == "tiled":
+        # Sliding Window: overlapping 512x512 tiles at native resolution, cosine blended.
+        # Tiles of one image are submitted together so they share forward passes.
+        blender = TileBlender(original_size[0], original_size[1], config.INPUT_SIZE)
+        for windows, batch in iter_tile_batches(image, config.INPUT_SIZE, config.TILE_OVERLAP, config.TILE_BATCH_SIZE):
+            prob_maps = await asyncio.gather(*[batcher.predict_async(tile) for tile in batch])
+            blender.add(windows, prob_maps)
+        prob_map_resized = blender.result()
+        mask_resized = (prob_map_resized > 0.5).astype(np.uint8)
+    else:
+        # Simple Resize for inference
+        img_resized = cv2.resize(image, (config.INPUT_SIZE, config.INPUT_SIZE))
+        
+        # Normalize
+        img_tensor = img_resized.astype(np.float32) / 255.0
+        img_tensor = torch.from_numpy(img_tensor).permute(2, 0, 1) # [C, H, W]
+        
+        # Inference (batched with concurrent requests)
+        prob_map = await batcher.predict_async(img_tensor)
+        mask = (prob_map > 0.5).astype(np.uint8)
+            
+        # Resize mask back to original size
+        mask_resized = cv2.resize(mask, (original_size[1], original_size[0]), interpolation=cv2.INTER_NEAREST)
+        prob_map_resized = cv2.resize(prob_map, (original_size[1], original_size[0]))
+    
+    return mask_resized, prob_map_resized
+
+# Finished responses keyed by input + model fingerprint (invalidated when the checkpoint changes)
+predict_cache = ResultCache("predict", model_fingerprint, db_path=cache_path(config.CACHE_DIR, config.RESULT_CACHE_PATH), memory_items=config.RESULT_CACHE_MEMORY_ITEMS)
+segment_cache = ResultCache("segment", model_fingerprint, db_path=cache_path(config.CACHE_DIR, config.RESULT_CACHE_PATH), memory_items=config.RESULT_CACHE_MEMORY_ITEMS)
 
 @app.post("/predict")
-async def predict_roof(file: UploadFile = File(...)):
+async def predict_roof(file: UploadFile = File(...), mode: str = config.INFERENCE_MODE, mask_encoding: str = None):
+    if mode not in INFERENCE_MODES:
+        return JSONResponse(content={"error": f"mode must be one of {', '.join(INFERENCE_MODES)}"}, status_code=400)
+    if mask_encoding and mask_encoding not in MASK_ENCODINGS:
+        return JSONResponse(content={"error": f"mask_encoding must be one of {', '.join(MASK_ENCODINGS)}"}, status_code=400)
+    
     # Read Image
     contents = await file.read()
-    nparr = np.fromstring(contents, np.uint8)
+    nparr = np.frombuffer(contents, np.uint8)
     image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        return JSONResponse(content={"error": "Could not decode image"}, status_code=400)
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     
-    # Preprocess
-    # Resize/Pad to expected input size if needed, or scan sliding window.
-    # For this simple endpoint, we assume input is close to training size or we resize.
-    original_size = image.shape[:2]
-    
-    # Simple Resize for inference (In prod: Sliding Window)
-    img_resized = cv2.resize(image, (config.INPUT_SIZE, config.INPUT_SIZE))
+    # Same decoded image + options with the same model -> cached GeoJSON
+    digest = await asyncio.to_thread(image_digest, image)
+    cache_key = predict_cache.key("predict", digest, mode, mask_encoding)
+    geojson = await predict_cache.aget(cache_key)
+    if geojson is not None:
+        return JSONResponse(content=geojson)
     
-    # Normalize
-    img_tensor = img_resized.astype(np.float32) / 255.0
-    img_tensor = torch.from_numpy(img_tensor).permute(2, 0, 1).unsqueeze(0) # [1, C, H, W]
-    img_tensor = img_tensor.to(device)
+    mask_resized, prob_map = await predict_image(image, mode)
     
-    # Inference
-    with torch.no_grad():
-        output = model(img_tensor)
-        prob_map = torch.sigmoid(output).squeeze().cpu().numpy()
-        mask = (prob_map > 0.5).astype(np.uint8)
-        
-    # Resize mask back to original size
-    mask_resized = cv2.resize(mask, (original_size[1], original_size[0]), interpolation=cv2.INTER_NEAREST)
+    # Vectorize (per-feature confidence = mean probability inside the polygon)
+    geojson = mask_to_geojson(mask_resized, prob_map=prob_map)
     
-    # Vectorize
-    geojson = mask_to_geojson(mask_resized)
+    # Optional compact mask (decode with mask_codec.decode_mask)
+    if mask_encoding:
+        geojson["mask"] = encode_mask(mask_resized, mask_encoding)
     
+    await predict_cache.aput(cache_key, geojson)
     return JSONResponse(content=geojson)
 
+# Staged /segment pipeline: blocking fetch / OpenCV work runs on bounded thread pools
+# The model method reuses /predict's batched inference (shared batching and warm-up)
+segment_pipeline = SegmentPipeline(predict=predict_image, cache=segment_cache)
+
 @app.get("/segment")
-async def segment_roof_location(lat: float, lng: float):
-    # Imports already handled globally
+async def segment_roof_location(lat: float, lng: float, method: str = config.SEGMENT_METHOD):
+    if method not in SEGMENT_METHODS:
+        return JSONResponse(content={"error": f"method must be one of {', '.join(SEGMENT_METHODS)}"}, status_code=400)
     
-    print(f"Segmenting request for {lat}, {lng}...")
-    
-    # 1. Fetch Tile
-    image, bbox = fetch_satellite_tile(lat, lng)
-    
-    if image is None:
-        return JSONResponse(content={"error": "Failed to fetch satellite tile"}, status_code=500)
+    print(f"Segmenting request for {lat}, {lng} ({method})...")
     
-    # 2. Segment (CV)
-    pixel_polygon = segment_roof_from_center(image)
+    try:
+        result = await segment_pipeline.segment(lat, lng, method=method)
+    except PipelineError as e:
+        headers = {"Retry-After": "1"} if e.status_code == 503 else None
+        return JSONResponse(content={"error": e.message}, status_code=e.status_code, headers=headers)
     
-    if len(pixel_polygon) == 0:
-        return JSONResponse(content={"error": "No roof segments detected"}, status_code=404)
-        
-    # 3. Convert to GeoCoords
-    geo_polygon = pixels_to_latlng(pixel_polygon, bbox, image.shape)
-    
-    # 4. Result
-    return JSONResponse(content={
-        "roofSegmentStats": [{"boundingPolygon": geo_polygon}],
-        "solarPotential": {
-            "wholeRoofStats": {
-                "areaMeters2": 100 # Placeholder for CV area calc
-            }
-        }
-    })
+    return JSONResponse(content=result)
+
+@app.get("/stats/batching")
+async def batching_stats():
+    return JSONResponse(content=get_batcher().stats())
+
+@app.get("/stats/segment")
+async def segment_stats():
+    return JSONResponse(content=segment_pipeline.stats())
+
+@app.get("/stats/cache")
+async def result_cache_stats():
+    return JSONResponse(content={"predict": predict_cache.stats(), "segment": segment_cache.stats()})
+
+@app.get("/stats/model")
+async def model_load_stats():
+    return JSONResponse(content=model_stats())
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,228 @@
+
+import os
+import csv
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import cv2
+
+from . import config
+from . import api
+from .utils import fetch_satellite_mosaic, mosaic_window, segment_roof_from_center, segment_roof_from_mask
+from .pipeline import SegmentPipeline, PipelineError, build_segment_result, SEGMENT_METHODS
+
+# Roof-area estimates for many locations (e.g. a whole neighbourhood):
+#     python -m roof_segmentation.batch_quote locations.csv quotes.csv
+#     python -m roof_segmentation.batch_quote locations.csv quotes.csv --resume
+# Input is CSV or Parquet (needs pyarrow) with lat / lng columns, read in chunks.
+# Points whose mosaic is the same (same tile for odd MOSAIC_SIZE) share one fetch
+# and one forward pass. Results are appended to the output CSV chunk by chunk and
+# <output>.progress.json records how far it got, so --resume continues from there.
+# Input sorted by location (e.g. by street) groups more points per mosaic.
+
+RESULT_FIELDS = ["status", "area_m2", "area_sqft", "polygon", "message"]
+
+def read_locations(path, chunk_size=1000):
+    """
+    Yields the input rows as dicts, streaming (never the whole file in memory).
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq # Optional dependency, only needed for Parquet input
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            for row in batch.to_pylist():
+                yield row
+    else:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row
+
+def iter_chunks(rows, chunk_size):
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def load_progress(path, input_path, method):
+    """
+    Returns (rows_done, output_bytes) from a previous run of the same job, or (0, 0).
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        progress = json.load(f)
+    if progress["input"] != os.path.abspath(input_path) or progress["method"] != method:
+        raise SystemExit(f"{path} belongs to another job ({progress['input']}, {progress['method']}). Remove it or pick another output.")
+    return progress["rows_done"], progress["output_bytes"]
+
+def save_progress(path, input_path, method, rows_done, output_bytes):
+    # Write then rename, so a crash never leaves a half-written progress file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"input": os.path.abspath(input_path), "method": method,
+                   "rows_done": rows_done, "output_bytes": output_bytes}, f)
+    os.replace(tmp_path, path)
+
+def summarize(result):
+    """
+    /segment response body -> output columns.
+    """
+    area_m2 = result["solarPotential"]["wholeRoofStats"]["areaMeters2"]
+    return {
+        "status": "ok",
+        "area_m2": area_m2,
+        "area_sqft": round(area_m2 * 10.7639, 2),
+        "polygon": json.dumps(result["roofSegmentStats"][0]["boundingPolygon"])
+    }
+
+def segment_point(source, click_pixel, bbox, img_shape, method):
+    """
+    Roof under one click of a fetched mosaic -> /segment response body, or None.
+    source: the model mask (method 'model') or the BGR mosaic (flood fill).
+    """
+    if method == "model":
+        pixel_polygon = segment_roof_from_mask(source, click_pixel)
+    else:
+        pixel_polygon = segment_roof_from_center(source, click_pixel)
+    if len(pixel_polygon) == 0:
+        return None
+    return build_segment_result(pixel_polygon, bbox, img_shape)
+
+async def quote_mosaic(pipeline, points, method, results):
+    """
+    Quotes every point that falls in one mosaic: a single fetch + forward pass,
+    then the component under each click. points: [(row, lat, lng, click_pixel)].
+    """
+    # 1. Points answered before (this run, a previous run or the API's disk cache)
+    pending = []
+    for point in points:
+        cached = await pipeline.cache.aget(pipeline.cache_key(point[1], point[2], method))
+        if cached is not None:
+            results[point[0]] = summarize(cached)
+        else:
+            pending.append(point)
+    if not pending:
+        return
+
+    # 2. Fetch + infer once for the whole mosaic
+    _, lat, lng, _ = pending[0]
+    try:
+        image, bbox, _ = await pipeline.run_stage("fetch", pipeline.io_pool, fetch_satellite_mosaic, lat, lng,
+                                                  timeout=pipeline.fetch_timeout)
+        if image is None:
+            raise PipelineError("Failed to fetch satellite tile", 500)
+        source = image
+        if method == "model":
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            source, _ = await pipeline.run_async_stage("infer", pipeline.predict(rgb), timeout=pipeline.infer_timeout)
+    except PipelineError as e:
+        for point in pending:
+            results[point[0]] = {"status": "error", "message": e.message}
+        return
+
+    # 3. Roof under each click (duplicate clicks share one result)
+    by_pixel = {}
+    for row, lat, lng, click_pixel in pending:
+        if click_pixel not in by_pixel:
+            try:
+                result = await pipeline.run_stage("segment", pipeline.cpu_pool, segment_point, source, click_pixel,
+                                                  bbox, image.shape, method, timeout=pipeline.cpu_timeout)
+            except PipelineError as e:
+                results[row] = {"status": "error", "message": e.message}
+                continue
+            if result is not None:
+                await pipeline.cache.aput(pipeline.cache_key(lat, lng, method), result)
+            by_pixel[click_pixel] = summarize(result) if result is not None else {"status": "no_roof"}
+        results[row] = by_pixel[click_pixel]
+
+async def quote_chunk(pipeline, chunk, method, lat_col, lng_col, max_mosaics):
+    """
+    Returns one result dict per row of chunk, in order.
+    """
+    results = [None] * len(chunk)
+    mosaics = {}
+    for row, location in enumerate(chunk):
+        try:
+            lat, lng = float(location[lat_col]), float(location[lng_col])
+        except (KeyError, TypeError, ValueError):
+            results[row] = {"status": "invalid", "message": f"Missing or bad {lat_col}/{lng_col}"}
+            continue
+        x0, y0, click_pixel = mosaic_window(lat, lng)
+        mosaics.setdefault((x0, y0), []).append((row, lat, lng, click_pixel))
+
+    # Bounded parallelism: at most max_mosaics fetch / infer at once
+    semaphore = asyncio.Semaphore(max_mosaics)
+    async def bounded(points):
+        async with semaphore:
+            await quote_mosaic(pipeline, points, method, results)
+    await asyncio.gather(*[bounded(points) for points in mosaics.values()])
+    return results, len(mosaics)
+
+async def run(args):
+    method = args.method
+    progress_path = args.output + ".progress.json"
+    rows_done, output_bytes = load_progress(progress_path, args.input, method) if args.resume else (0, 0)
+    if rows_done and not os.path.exists(args.output):
+        raise SystemExit(f"{args.output} is missing; cannot resume. Remove {progress_path} to start over.")
+
+    predict = None
+    if method == "model":
+        # Model loaded (and warmed up) before the first chunk; forward passes are micro-batched
+        await asyncio.to_thread(api.get_batcher)
+        predict = api.predict_image
+    # Shares the API's result cache, so --resume and repeated points skip finished work
+    pipeline = SegmentPipeline(predict=predict, cache=api.segment_cache, io_workers=args.workers,
+                               cpu_workers=config.SEGMENT_CPU_WORKERS)
+
+    rows = read_locations(args.input, args.chunk_size)
+    if rows_done:
+        print(f"Resuming after {rows_done} rows")
+        rows = itertools.islice(rows, rows_done, None)
+
+    with open(args.output, "a+" if rows_done else "w", newline="") as out:
+        # Drop rows written after the last checkpoint (they are redone)
+        out.truncate(output_bytes)
+        out.seek(output_bytes)
+        writer = None
+        start = time.perf_counter()
+        done = 0
+        for chunk in iter_chunks(rows, args.chunk_size):
+            results, mosaic_count = await quote_chunk(pipeline, chunk, method, args.lat_col, args.lng_col, args.workers)
+
+            if writer is None:
+                fieldnames = list(chunk[0].keys()) + [f for f in RESULT_FIELDS if f not in chunk[0]]
+                writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction="ignore")
+                if output_bytes == 0:
+                    writer.writeheader()
+            for location, result in zip(chunk, results):
+                writer.writerow({**location, **result})
+            out.flush()
+            os.fsync(out.fileno())
+
+            done += len(chunk)
+            rows_done += len(chunk)
+            save_progress(progress_path, args.input, method, rows_done, out.tell())
+            elapsed = time.perf_counter() - start
+            print(f"{rows_done} rows done ({done / elapsed:.1f} rows/s, {len(chunk)} rows in {mosaic_count} mosaics)")
+
+    print(f"Finished {args.input} -> {args.output}")
+    print(json.dumps({"pipeline": pipeline.stats(), "cache": api.segment_cache.stats()}, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Roof-area estimates for a CSV / Parquet file of locations.")
+    parser.add_argument("input", help="CSV or .parquet with one location per row")
+    parser.add_argument("output", help="CSV: input columns + " + ", ".join(RESULT_FIELDS))
+    parser.add_argument("--lat-col", default="lat")
+    parser.add_argument("--lng-col", default="lng")
+    parser.add_argument("--method", default=config.SEGMENT_METHOD, choices=SEGMENT_METHODS)
+    parser.add_argument("--workers", type=int, default=16, help="Mosaics fetched / segmented concurrently")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows read, grouped and checkpointed together")
+    parser.add_argument("--resume", action="store_true", help="Continue after the last checkpointed chunk")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+
+import time
+import queue
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+
+
+class _Request:
+    __slots__ = ("tensor", "future", "enqueued_at")
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceBatcher:
+    """
+    Dynamic micro-batching scheduler for DeepLabV3Plus.
+    Collects [C, H, W] tensors for up to `max_wait_ms` (or until `max_batch_size`
+    requests are waiting), runs a single forward pass on a worker thread and
+    hands every caller its own slice of the sigmoid probability map.
+    """
+    def __init__(self, model, device, max_batch_size=8, max_wait_ms=10):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._requests = 0
+        self._batches = 0
+        self._forward_seconds = 0.0
+        self._wait_seconds = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._worker.start()
+
+    # --- Public API ---
+
+    def submit(self, tensor):
+        """
+        Enqueues a [C, H, W] float tensor. Returns a concurrent Future resolving
+        to the [H, W] probability map (numpy float32).
+        """
+        request = _Request(tensor)
+        self._queue.put(request)
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._requests += 1
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return request.future
+
+    def predict(self, tensor):
+        """Blocking variant for synchronous callers."""
+        return self.submit(tensor).result()
+
+    async def predict_async(self, tensor):
+        """Awaitable variant; never blocks the event loop."""
+        return await asyncio.wrap_future(self.submit(tensor))
+
+    def stats(self):
+        """
+        Snapshot of queue depth and batch-size histogram for tuning
+        max_batch_size / max_wait_ms against p99 latency.
+        """
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "batches": batches,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "mean_batch_size": (sum(k * v for k, v in self._batch_sizes.items()) / batches) if batches else 0.0,
+                "mean_forward_ms": (self._forward_seconds / batches * 1000.0) if batches else 0.0,
+                "mean_queue_wait_ms": (self._wait_seconds / self._requests * 1000.0) if self._requests else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    # --- Worker ---
+
+    def _collect(self):
+        """
+        Blocks for the first request, then gathers more until the batch is
+        full or the wait window closes.
+        """
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            # Tensors of different spatial sizes cannot be stacked; run one pass per shape.
+            groups = {}
+            for request in batch:
+                groups.setdefault(tuple(request.tensor.shape), []).append(request)
+
+            for requests in groups.values():
+                # One failed batch must not stop the worker (every later request would hang)
+                try:
+                    self._forward(requests)
+                except Exception as e:
+                    print(f"Inference batcher: batch of {len(requests)} failed: {e!r}")
+
+    def _forward(self, requests):
+        # Requests cancelled while queued (client gone, pipeline timeout) are dropped;
+        # the rest are marked running so they can no longer be cancelled
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+
+        started = time.perf_counter()
+        try:
+            images = torch.stack([r.tensor for r in requests]).to(self.device)
+            with torch.no_grad():
+                output = self.model(images)
+                prob_maps = torch.sigmoid(output)[:, 0].cpu().numpy()
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self._batches += 1
+            self._batch_sizes[len(requests)] += 1
+            self._forward_seconds += finished - started
+            self._wait_seconds += sum(started - r.enqueued_at for r in requests)
+
+        for request, prob_map in zip(requests, prob_maps):
+            request.future.set_result(prob_map)
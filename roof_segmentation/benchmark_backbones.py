@@ -0,0 +1,84 @@
+
+import os
+import time
+import argparse
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+import config
+from model import DeepLabV3Plus, BACKBONES
+from dataset import RoofDataset
+from train import split_dataset
+from export import evaluate_iou
+
+def count_flops(model, input_size=config.INPUT_SIZE):
+    """
+    FLOPs (2 x multiply-accumulates) of convolutions for one input_size image.
+    Convs dominate DeepLabv3+; BN/activations/interpolation are ignored.
+    """
+    macs = [0]
+
+    def hook(module, inputs, output):
+        kh, kw = module.kernel_size
+        macs[0] += output.numel() * (module.in_channels // module.groups) * kh * kw
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, nn.Conv2d)]
+    with torch.no_grad():
+        model(torch.rand(1, 3, input_size, input_size))
+    for h in handles:
+        h.remove()
+    return 2 * macs[0]
+
+def measure_latency(model, input_size=config.INPUT_SIZE, runs=5, warmup=2):
+    """
+    Median CPU latency (ms) for a batch of one input_size image.
+    """
+    x = torch.rand(1, 3, input_size, input_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000.0)
+    return sorted(timings)[len(timings) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DeepLabV3Plus backbones: params, FLOPs, CPU latency, val mIoU.")
+    parser.add_argument("--backbones", nargs="+", default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument("--output-stride", type=int, default=config.OUTPUT_STRIDE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--checkpoint-pattern", default="checkpoints/best_model_{backbone}.pth",
+                        help="Checkpoints written by `train.py --backbone X --checkpoint ...`, used for val mIoU")
+    args = parser.parse_args()
+
+    device = torch.device('cpu')
+    val_loader = None
+    full_dataset = RoofDataset(image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, input_size=config.INPUT_SIZE)
+    if len(full_dataset) > 0:
+        _, val_dataset = split_dataset(full_dataset)
+        val_loader = DataLoader(val_dataset, batch_size=config.BATCH_SIZE, shuffle=False)
+
+    rows = []
+    for backbone in args.backbones:
+        model = DeepLabV3Plus(n_classes=config.NUM_CLASSES, backbone=backbone, output_stride=args.output_stride, pretrained=False).eval()
+
+        miou = "n/a"
+        checkpoint = args.checkpoint_pattern.format(backbone=backbone)
+        if val_loader is not None and os.path.exists(checkpoint):
+            model.load_state_dict(torch.load(checkpoint, map_location=device))
+            miou = f"{evaluate_iou(model, val_loader, device)['miou']:.4f}"
+
+        params = sum(p.numel() for p in model.parameters())
+        rows.append((backbone, params / 1e6, count_flops(model) / 1e9, measure_latency(model, runs=args.runs), miou))
+        print(f"Measured {backbone}")
+
+    print(f"\nDeepLabV3Plus @ {config.INPUT_SIZE}x{config.INPUT_SIZE}, OS{args.output_stride}, {torch.get_num_threads()} CPU threads\n")
+    print("| Backbone | Params (M) | GFLOPs | CPU latency (ms) | Val mIoU |")
+    print("| :--- | ---: | ---: | ---: | ---: |")
+    for backbone, params, gflops, latency, miou in rows:
+        print(f"| {backbone} | {params:.1f} | {gflops:.1f} | {latency:.0f} | {miou} |")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+
+import os
+import re
+import glob
+import queue
+import random
+import threading
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = "checkpoint_epoch{epoch:03d}.pth"
+
+def to_cpu(obj):
+    """
+    Recursively copies tensors in a (nested) state dict to CPU, so the snapshot
+    is immune to the training loop updating parameters in place.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+def rng_state(generator=None):
+    """
+    Global Python / NumPy / torch (and CUDA) RNG states, plus the state of
+    generator (e.g. the training loader's shuffle / worker-seed stream) if given.
+    """
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    if generator is not None:
+        state["loader"] = generator.get_state()
+    return state
+
+def restore_rng_state(state, generator=None):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    if "loader" in state and generator is not None:
+        generator.set_state(state["loader"])
+
+def training_state(model, optimizer, scaler, epoch, best_metric, loader_generator=None):
+    """
+    Full training snapshot (on CPU): model, optimizer, grad scaler, epoch,
+    best metric and every RNG stream the training loop draws from
+    (loader_generator: the generator passed to the training DataLoader).
+    """
+    return to_cpu({
+        "epoch": epoch,
+        "best_metric": best_metric,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scaler": scaler.state_dict(),
+        "rng": rng_state(loader_generator),
+    })
+
+def latest_checkpoint(directory):
+    """
+    Path of the highest-epoch checkpoint in directory, or None.
+    """
+    paths = glob.glob(os.path.join(directory, "checkpoint_epoch*.pth"))
+    if not paths:
+        return None
+    return max(paths, key=lambda p: int(re.search(r"epoch(\d+)", os.path.basename(p)).group(1)))
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints from a background thread so training never blocks on
+    disk I/O. Each file is written to a temporary path and atomically renamed
+    (os.replace), so a crash mid-write never leaves a truncated checkpoint.
+    Only the last `keep_last` epoch checkpoints are kept.
+    """
+    def __init__(self, directory, keep_last=3):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.error = None
+        self._queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._worker, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, state, path):
+        """
+        Queues `state` (already a CPU snapshot, e.g. from training_state) for writing.
+        """
+        self._raise_error()
+        self._queue.put((state, path))
+
+    def save_epoch(self, state):
+        path = os.path.join(self.directory, CHECKPOINT_PATTERN.format(epoch=state["epoch"]))
+        self.save(state, path)
+        return path
+
+    def wait(self):
+        """
+        Blocks until every queued checkpoint is on disk.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}")
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            state, path = item
+            try:
+                tmp_path = path + ".tmp"
+                torch.save(state, tmp_path)
+                os.replace(tmp_path, path)
+                self._prune()
+            except Exception as e:
+                print(f"Error writing checkpoint {path}: {e}")
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        paths = glob.glob(os.path.join(self.directory, "checkpoint_epoch*.pth"))
+        paths.sort(key=lambda p: int(re.search(r"epoch(\d+)", os.path.basename(p)).group(1)))
+        for path in paths[:-self.keep_last] if self.keep_last > 0 else []:
+            os.remove(path)
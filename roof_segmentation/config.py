@@ -1,10 +1,12 @@
 
+import os
+
 # DeepLabv3+ Configuration
 # Based on prompt specifications for optimal roof segmentation
 
 # Model Architecture
-BACKBONE = "resnet101" # Options: resnet101, xception
-OUTPUT_STRIDE = 16
+BACKBONE = "resnet101" # Options: resnet18, resnet34, resnet50, resnet101, mobilenet_v3_large
+OUTPUT_STRIDE = 32 # 8, 16 or 32; lower = finer features, slower. 32 = undilated backbone, what existing best_model.pth checkpoints were trained at (8/16 need retraining)
 NUM_CLASSES = 1 # Binary segmentation (Roof vs Background)
 
 # Training Hyperparameters
@@ -12,16 +14,96 @@ BATCH_SIZE = 5
 LEARNING_RATE = 1e-4 # 0.0001
 EPOCHS = 100
 INPUT_SIZE = 512 # 512x512 tiles
+SPLIT_SEED = 42 # Fixed train/val split
+
+# Mixed Precision / Memory Format
+AMP_ENABLED = False # Autocast forward pass (GradScaler is used for float16)
+AMP_DTYPE = "auto" # auto (bfloat16 on CPU, float16 on CUDA), bfloat16, float16
+GRAD_ACCUM_STEPS = 1 # Effective batch = BATCH_SIZE * GRAD_ACCUM_STEPS
+CHANNELS_LAST = False # NHWC memory format (faster convs on tensor cores / oneDNN)
+
+# Distributed Training (torchrun)
+DIST_BACKEND = "gloo" # gloo (CPU / any), nccl (multi-GPU)
+SYNC_BATCHNORM = True # Convert BatchNorm to SyncBatchNorm under DDP (CUDA only)
 
 # Focal Loss Parameters
 LOSS_ALPHA = 0.25
 LOSS_GAMMA = 2.0
+FUSED_FOCAL_LOSS = True # Hand-written backward, no activation-sized intermediates kept (see loss.py)
 
 # Paths
 DATA_DIR = "data/raw"
 PROCESSED_DIR = "data/processed"
 CHECKPOINT_DIR = "checkpoints"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache") # Relative *_CACHE_PATH values are resolved here
 BEST_MODEL_PATH = "checkpoints/best_model.pth"
+CHECKPOINT_EVERY = 1 # Full resumable checkpoint every N epochs (0 disables)
+CHECKPOINT_KEEP_LAST = 3 # Older checkpoint_epochXXX.pth files are deleted
 
 # Post-processing
 SIMPLIFICATION_EPSILON = 1.0 # Tolerance for Ramer-Douglas-Peucker
+
+# Inference Batching (api.py)
+BATCH_MAX_SIZE = 8 # Max images per forward pass
+BATCH_MAX_WAIT_MS = 10 # Max time a request waits for others to join its batch
+
+# Multi-Worker Serving (serve.py)
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 8000
+SERVE_WORKERS = 2 # Forked uvicorn workers sharing one copy of the weights
+SERVE_THREADS_PER_WORKER = 0 # torch intra-op threads per worker (0 = cpu cores // SERVE_WORKERS)
+SERVE_RESTART_DELAY = 1.0 # Seconds before restarting a dead worker; doubles per consecutive startup failure
+SERVE_MAX_RESTART_DELAY = 30.0
+SERVE_MAX_STARTUP_FAILURES = 5 # Consecutive deaths before becoming ready (bad checkpoint, port...) -> server exits
+
+# Large Image Inference
+INFERENCE_MODE = "resize" # Options: resize (1 forward pass), tiled (sliding window, ~88 passes for a 4000x3000 photo)
+TILE_OVERLAP = 128 # Pixels shared by neighbouring 512x512 tiles (cosine blended)
+TILE_BATCH_SIZE = 4 # Tiles per forward pass
+
+# Satellite Tiles (utils.fetch_satellite_tile)
+TILE_URL_TEMPLATE = "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}" # Esri World Imagery
+TILE_FETCH_TIMEOUT = 5 # Seconds
+TILE_CACHE_PATH = "tiles.sqlite" # Under CACHE_DIR unless absolute; None disables the disk tier
+TILE_CACHE_MEMORY_ITEMS = 512 # Decoded 256x256 tiles kept in RAM (~200 KB each)
+TILE_CACHE_TTL_SECONDS = 30 * 24 * 3600
+TILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MOSAIC_SIZE = 3 # /segment fetches the NxN block of tiles around the click
+TILE_FETCH_WORKERS = 16 # Parallel tile downloads
+
+# /segment Pipeline (pipeline.py)
+SEGMENT_IO_WORKERS = 32 # Threads for tile fetching (blocking HTTP + cache)
+SEGMENT_CPU_WORKERS = 4 # Threads for OpenCV / projection stages (OpenCV releases the GIL)
+SEGMENT_MAX_INFLIGHT = 64 # Requests in the pipeline before new ones get 503
+SEGMENT_FETCH_TIMEOUT = 10 # Seconds for the mosaic fetch stage
+SEGMENT_CPU_TIMEOUT = 5 # Seconds per CPU stage
+SEGMENT_INFER_TIMEOUT = 15 # Seconds for the model stage (queueing in the batcher included)
+SEGMENT_METHOD = "model" # Default /segment method: model (DeepLabV3Plus) or floodfill (colour flood fill fast path)
+SEGMENT_SNAP_RADIUS = 8 # Pixels: a click just off a predicted roof snaps to the nearest roof within this radius
+
+# Inference Runtime (export.py produces the artifacts)
+INFERENCE_RUNTIME = "eager" # Options: eager, torchscript, int8, onnx
+EXPORT_DIR = "checkpoints/export"
+TORCHSCRIPT_MODEL_PATH = "checkpoints/export/model_fp32.pt"
+INT8_MODEL_PATH = "checkpoints/export/model_int8.pt"
+ONNX_MODEL_PATH = "checkpoints/export/model.onnx"
+QUANT_CALIBRATION_SAMPLES = 64 # RoofDataset tiles used to calibrate int8 activations
+
+# Inference Optimization (optimize.py, eager runtime only)
+INFERENCE_OPTIMIZE = False # Fold BatchNorm into convs and fuse the ASPP pooling branch
+INFERENCE_COMPILE = False # Also wrap with torch.compile (needs a C++ toolchain on CPU)
+COMPILE_MODE = "default" # torch.compile mode: default, reduce-overhead, max-autotune
+
+# Result Cache (result_cache.py: /predict, /segment, RoofInferenceEngine)
+RESULT_CACHE_MEMORY_ITEMS = 256 # Results kept in RAM per cache (LRU)
+RESULT_CACHE_PATH = None # e.g. "results.sqlite" (under CACHE_DIR unless absolute) to share results across workers / restarts
+
+# Training Data
+TRAIN_SHARD = None # e.g. "data/shards/train" (packed by shards.py); None reads images from DATA_DIR
+
+# Input Pipeline (data_loading.py)
+NUM_WORKERS = 4 # DataLoader worker processes (decode + augmentation off the training loop)
+PIN_MEMORY = True # Page-locked host buffers for async host->GPU copies (CUDA only)
+PREFETCH_FACTOR = 4 # Batches each worker prepares ahead
+PERSISTENT_WORKERS = True # Keep workers alive between epochs (not for the augmented training loader: its RNG must be reseeded per epoch for --resume)
+AUGMENT = True # Random flips / 90 degree rotations on training tiles
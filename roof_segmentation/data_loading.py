@@ -0,0 +1,160 @@
+
+import os
+import copy
+import time
+import random
+import argparse
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+try:
+    import config
+    from shards import normalize_images
+except ImportError:
+    from . import config
+    from .shards import normalize_images
+
+class RoofAugment:
+    """
+    Worker-side geometric augmentation on uint8 arrays (before normalization):
+    random horizontal/vertical flips and 90 degree rotations. Aerial tiles have
+    no canonical orientation, so all 8 dihedral variants are valid samples.
+    Uses the `random` module, which DataLoader seeds differently per worker.
+    """
+    def __call__(self, image, mask):
+        k = random.randint(0, 3)
+        flip = random.random() < 0.5
+        image = np.rot90(image, k, axes=(0, 1))
+        if flip:
+            image = image[:, ::-1]
+        image = np.ascontiguousarray(image)
+        if mask is not None:
+            mask = np.rot90(mask, k, axes=(0, 1))
+            if flip:
+                mask = mask[:, ::-1]
+            mask = np.ascontiguousarray(mask)
+        return image, mask
+
+def with_transform(dataset, transform):
+    """
+    Shallow copy of a RoofDataset/ShardDataset with a different transform,
+    so train and val subsets of one corpus can augment differently.
+    """
+    dataset = copy.copy(dataset)
+    dataset.transform = transform
+    return dataset
+
+def build_loader(dataset, shuffle, batch_size=config.BATCH_SIZE, sampler=None, drop_last=False, generator=None,
+                 persistent_workers=None):
+    """
+    DataLoader configured for throughput from config: multi-process workers,
+    pinned host memory (CUDA only), prefetch depth and persistent workers.
+    generator: torch.Generator for the shuffle order and the workers' seeds
+    (default: the global torch RNG).
+    persistent_workers: defaults to config.PERSISTENT_WORKERS.
+    """
+    workers = config.NUM_WORKERS
+    kwargs = {}
+    if workers > 0:
+        kwargs["prefetch_factor"] = config.PREFETCH_FACTOR
+        kwargs["persistent_workers"] = config.PERSISTENT_WORKERS if persistent_workers is None else persistent_workers
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle if sampler is None else False,
+        sampler=sampler,
+        num_workers=workers,
+        pin_memory=config.PIN_MEMORY and torch.cuda.is_available(),
+        drop_last=drop_last,
+        generator=generator,
+        **kwargs
+    )
+
+class ThroughputMeter:
+    """
+    Splits each training step into data wait (blocked on the loader) and
+    compute, to show whether the accelerator is starved.
+    """
+    def __init__(self):
+        self.data_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.samples = 0
+        self.steps = 0
+        self._mark = time.perf_counter()
+
+    def data_ready(self):
+        now = time.perf_counter()
+        self.data_seconds += now - self._mark
+        self._mark = now
+
+    def step_done(self, batch_size):
+        now = time.perf_counter()
+        self.compute_seconds += now - self._mark
+        self._mark = now
+        self.samples += batch_size
+        self.steps += 1
+
+    def summary(self):
+        total = self.data_seconds + self.compute_seconds
+        return {
+            "samples_per_sec": self.samples / total if total else 0.0,
+            "data_wait_fraction": self.data_seconds / total if total else 0.0,
+            "mean_step_ms": total / self.steps * 1000.0 if self.steps else 0.0,
+        }
+
+def benchmark_loader(loader, device, steps=50, step_fn=None):
+    """
+    Iterates the loader for `steps` batches and reports samples/sec and the
+    fraction of each step spent waiting on data. step_fn(images, masks) stands
+    in for the training step (omit it to measure the raw input pipeline).
+    """
+    meter = ThroughputMeter()
+    for i, (images, masks) in enumerate(loader):
+        if i >= steps:
+            break
+        images = normalize_images(images, device)
+        masks = masks.to(device, non_blocking=True)
+        meter.data_ready()
+        if step_fn is not None:
+            step_fn(images, masks)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        meter.step_done(images.shape[0])
+    return meter.summary()
+
+if __name__ == '__main__':
+    from dataset import RoofDataset
+    from shards import ShardDataset
+    from model import DeepLabV3Plus
+    from loss import FocalLoss
+
+    parser = argparse.ArgumentParser(description="Benchmark the training input pipeline.")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--with-model", action="store_true", help="Include a forward/backward pass per step")
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if config.TRAIN_SHARD and os.path.exists(config.TRAIN_SHARD + ".index.json"):
+        dataset = ShardDataset(config.TRAIN_SHARD, transform=RoofAugment() if config.AUGMENT else None)
+    else:
+        dataset = RoofDataset(image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, input_size=config.INPUT_SIZE,
+                              transform=RoofAugment() if config.AUGMENT else None)
+    loader = build_loader(dataset, shuffle=True)
+
+    train_step = None
+    if args.with_model:
+        model = DeepLabV3Plus(n_classes=1, backbone=config.BACKBONE, output_stride=config.OUTPUT_STRIDE, pretrained=False).to(device)
+        criterion = FocalLoss(alpha=config.LOSS_ALPHA, gamma=config.LOSS_GAMMA)
+        optimizer = torch.optim.Adam(model.parameters(), lr=config.LEARNING_RATE)
+
+        def train_step(images, masks):
+            optimizer.zero_grad()
+            criterion(model(images), masks.float()).backward()
+            optimizer.step()
+
+    stats = benchmark_loader(loader, device, steps=args.steps, step_fn=train_step)
+    print(f"workers={config.NUM_WORKERS} prefetch={config.PREFETCH_FACTOR} pin_memory={config.PIN_MEMORY}")
+    print(f"{stats['samples_per_sec']:.1f} samples/sec, data wait {stats['data_wait_fraction'] * 100:.1f}% of step time, "
+          f"{stats['mean_step_ms']:.1f} ms/step")
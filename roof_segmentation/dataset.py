@@ -21,7 +21,11 @@ class RoofDataset(Dataset):
     def __len__(self):
         return len(self.images)
 
-    def __getitem__(self, idx):
+    def load_uint8(self, idx):
+        """
+        Loads sample idx as uint8 arrays: image [H, W, 3] RGB and mask [H, W]
+        of 0/1 labels (None without mask_dir). Padded/cropped to input_size.
+        """
         img_name = self.images[idx]
         img_path = os.path.join(self.image_dir, img_name)
         
@@ -43,32 +47,63 @@ class RoofDataset(Dataset):
         # Ideally, we slice beforehand. Here we just ensure 512x512 compliance.
         image = image[:self.input_size, :self.input_size, :]
         
+        if not self.mask_dir:
+            return image, None
+        
+        mask_path = os.path.join(self.mask_dir, img_name)
+        # Try png if jpg not found for mask
+        if not os.path.exists(mask_path):
+             base, _ = os.path.splitext(img_name)
+             mask_path = os.path.join(self.mask_dir, base + ".png")
+
+        if os.path.exists(mask_path):
+            mask = cv2.imread(mask_path, 0) # Grayscale
+            if pad_h > 0 or pad_w > 0:
+                mask = cv2.copyMakeBorder(mask, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=0)
+            mask = mask[:self.input_size, :self.input_size]
+            # Label classes: only fully white (255) pixels are roof
+            mask = (mask >= 255).astype(np.uint8)
+        else:
+            # If no mask found, return empty (for inference or weakly supervised)
+            mask = np.zeros((self.input_size, self.input_size), np.uint8)
+            
+        return image, mask
+
+    def __getitem__(self, idx):
+        image, mask = self.load_uint8(idx)
+        
+        # Augment on uint8 (runs inside DataLoader workers)
+        if self.transform is not None:
+            image, mask = self.transform(image, mask)
+        
         # Normalize
         image = image.astype(np.float32) / 255.0
         image = torch.from_numpy(image).permute(2, 0, 1) # C, H, W
         
         if self.mask_dir:
-            mask_path = os.path.join(self.mask_dir, img_name)
-            # Try png if jpg not found for mask
-            if not os.path.exists(mask_path):
-                 base, _ = os.path.splitext(img_name)
-                 mask_path = os.path.join(self.mask_dir, base + ".png")
-
-            if os.path.exists(mask_path):
-                mask = cv2.imread(mask_path, 0) # Grayscale
-                if pad_h > 0 or pad_w > 0:
-                    mask = cv2.copyMakeBorder(mask, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=0)
-                mask = mask[:self.input_size, :self.input_size]
-                mask = mask.astype(np.float32) / 255.0
-                mask = torch.from_numpy(mask).long() # Label classes
-            else:
-                # If no mask found, return empty (for inference or weakly supervised)
-                 mask = torch.zeros((self.input_size, self.input_size)).long()
-            
-            return image, mask
+            return image, torch.from_numpy(mask).long()
             
         return image
 
+def iter_tile_windows(h, w, tile_size=512, stride=512):
+    """
+    Yields (y, x, y_end, x_end) windows covering an h x w image.
+    Windows at the right/bottom edge may be smaller than tile_size (pad with pad_tile).
+    """
+    for y in range(0, max(h - tile_size, 0) + stride, stride):
+        for x in range(0, max(w - tile_size, 0) + stride, stride):
+            # Safe crop
+            yield y, x, min(y + tile_size, h), min(x + tile_size, w)
+
+def pad_tile(tile, tile_size=512):
+    """
+    Zero-pads an incomplete edge tile (bottom/right) up to tile_size.
+    """
+    th, tw = tile.shape[:2]
+    if th < tile_size or tw < tile_size:
+        tile = cv2.copyMakeBorder(tile, 0, tile_size - th, 0, tile_size - tw, cv2.BORDER_CONSTANT, value=0)
+    return tile
+
 def slice_large_image(image_path, output_dir, tile_size=512, stride=512):
     """
     Slices a large HSR image into smaller tiles.
@@ -79,20 +114,9 @@ def slice_large_image(image_path, output_dir, tile_size=512, stride=512):
     img = cv2.imread(image_path)
     h, w = img.shape[:2]
     
-    idx = 0
-    for y in range(0, h, stride):
-        for x in range(0, w, stride):
-            # Safe crop
-            y_end = min(y + tile_size, h)
-            x_end = min(x + tile_size, w)
-            
-            tile = img[y:y_end, x:x_end]
+    for idx, (y, x, y_end, x_end) in enumerate(iter_tile_windows(h, w, tile_size, stride)):
+        # Pad if incomplete tile
+        tile = pad_tile(img[y:y_end, x:x_end], tile_size)
             
-            # Pad if incomplete tile
-            th, tw = tile.shape[:2]
-            if th < tile_size or tw < tile_size:
-                tile = cv2.copyMakeBorder(tile, 0, tile_size - th, 0, tile_size - tw, cv2.BORDER_CONSTANT, value=0)
-                
-            out_name = f"{os.path.splitext(os.path.basename(image_path))[0]}_tile_{idx}.png"
-            cv2.imwrite(os.path.join(output_dir, out_name), tile)
-            idx += 1
+        out_name = f"{os.path.splitext(os.path.basename(image_path))[0]}_tile_{idx}.png"
+        cv2.imwrite(os.path.join(output_dir, out_name), tile)
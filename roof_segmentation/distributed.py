@@ -0,0 +1,71 @@
+
+import os
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+try:
+    import config
+except ImportError:
+    from . import config
+
+def setup_distributed():
+    """
+    Initializes the process group when launched by torchrun (WORLD_SIZE > 1),
+    e.g. `torchrun --nproc_per_node=4 train.py` or multi-node with --nnodes/--rdzv_endpoint.
+    Returns (rank, world_size, device). Plain `python train.py` runs single-process.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1, torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    backend = config.DIST_BACKEND
+    if backend == "nccl" and not torch.cuda.is_available():
+        print("Warning: nccl requested but CUDA is not available. Falling back to gloo.")
+        backend = "gloo"
+    dist.init_process_group(backend=backend)
+
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+        device = torch.device('cuda', local_rank)
+    else:
+        device = torch.device('cpu')
+    return dist.get_rank(), world_size, device
+
+def cleanup_distributed():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def is_main_process():
+    return not (dist.is_available() and dist.is_initialized()) or dist.get_rank() == 0
+
+def wrap_model(model, device):
+    """
+    Wraps the model for DDP. BatchNorm layers (backbone, SeparableConv2d, ASPP)
+    are converted to SyncBatchNorm on CUDA so statistics cover the global batch;
+    PyTorch's SyncBatchNorm is GPU-only, so CPU/gloo runs keep per-process BN.
+    """
+    if not (dist.is_available() and dist.is_initialized()):
+        return model
+    if device.type == 'cuda' and config.SYNC_BATCHNORM:
+        model = nn.SyncBatchNorm.convert_sync_batchnorm(model)
+    elif config.SYNC_BATCHNORM and is_main_process():
+        print("Note: SyncBatchNorm requires CUDA; using per-process BatchNorm on CPU.")
+    device_ids = [device.index] if device.type == 'cuda' else None
+    return DistributedDataParallel(model, device_ids=device_ids)
+
+def unwrap_model(model):
+    """
+    The underlying DeepLabV3Plus, so checkpoints keep plain (non 'module.') keys.
+    """
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+def all_reduce_sum(tensor):
+    """
+    In-place sum across processes (no-op when single-process).
+    """
+    if dist.is_available() and dist.is_initialized():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
@@ -0,0 +1,130 @@
+
+import os
+import argparse
+import torch
+from torch.utils.data import DataLoader, Subset
+
+import config
+from dataset import RoofDataset
+from runtime import load_eager_model, load_model
+from metrics import SegmentationMetrics
+
+def export_torchscript(model, path, input_size=config.INPUT_SIZE):
+    """
+    Traces the float32 model to TorchScript.
+    """
+    example = torch.rand(1, 3, input_size, input_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced)
+    traced.save(path)
+    print(f"TorchScript model saved to {path}")
+    return traced
+
+def export_onnx(model, path, input_size=config.INPUT_SIZE):
+    """
+    Exports to ONNX with dynamic batch (and spatial) dimensions.
+    """
+    example = torch.rand(1, 3, input_size, input_size)
+    torch.onnx.export(
+        model, example, path,
+        input_names=["image"], output_names=["logits"],
+        dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"}, "logits": {0: "batch", 2: "height", 3: "width"}},
+        opset_version=17,
+        dynamo=False
+    )
+    print(f"ONNX model saved to {path}")
+
+def calibration_loader(num_samples=config.QUANT_CALIBRATION_SAMPLES, batch_size=config.BATCH_SIZE):
+    """
+    Random sample of RoofDataset tiles for int8 calibration / accuracy checks.
+    Returns None if no data is available.
+    """
+    dataset = RoofDataset(image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, input_size=config.INPUT_SIZE)
+    if len(dataset) == 0:
+        return None
+    generator = torch.Generator().manual_seed(0)
+    indices = torch.randperm(len(dataset), generator=generator)[:num_samples].tolist()
+    return DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False)
+
+def quantize_int8(model, loader, path, input_size=config.INPUT_SIZE):
+    """
+    Post-training static int8 quantization (FX graph mode), activations
+    calibrated on `loader`. Saved as TorchScript for the 'int8' runtime.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    backend = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = backend
+
+    example = torch.rand(1, 3, input_size, input_size)
+    prepared = prepare_fx(model.cpu().eval(), get_default_qconfig_mapping(backend), example_inputs=(example,))
+
+    print("Calibrating int8 activations...")
+    with torch.no_grad():
+        if loader is None:
+            print("Warning: No data found. Calibrating on random tiles (accuracy will suffer).")
+            for _ in range(4):
+                prepared(torch.rand(config.BATCH_SIZE, 3, input_size, input_size))
+        else:
+            for images, _ in loader:
+                prepared(images)
+
+    quantized = convert_fx(prepared)
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, example)
+    traced = torch.jit.freeze(traced)
+    traced.save(path)
+    print(f"Int8 model saved to {path}")
+    return traced
+
+def evaluate_iou(model, loader, device):
+    """
+    Global IoU / mIoU (roof + background) and the other SegmentationMetrics over the loader.
+    """
+    metrics = SegmentationMetrics(n_classes=2, device=device)
+    with torch.no_grad():
+        for images, masks in loader:
+            metrics.update_logits(model(images.to(device)), masks)
+    return metrics.compute()
+
+def report_accuracy(runtimes, loader):
+    """
+    IoU of each exported runtime against the eager float32 model.
+    """
+    device = torch.device('cpu')
+    reference = evaluate_iou(load_eager_model(device), loader, device)
+    print(f"eager      mIoU {reference['miou']:.4f}  roof IoU {reference['roof_iou']:.4f}  boundary F {reference['boundary_f']:.4f}")
+    for runtime in runtimes:
+        scores = evaluate_iou(load_model(runtime, device), loader, device)
+        delta = scores["miou"] - reference["miou"]
+        print(f"{runtime:<10} mIoU {scores['miou']:.4f}  roof IoU {scores['roof_iou']:.4f}  boundary F {scores['boundary_f']:.4f}  delta mIoU {delta:+.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export DeepLabV3Plus for optimized CPU inference.")
+    parser.add_argument("--formats", nargs="+", default=["torchscript", "onnx", "int8"], choices=["torchscript", "onnx", "int8"])
+    parser.add_argument("--calibration-samples", type=int, default=config.QUANT_CALIBRATION_SAMPLES)
+    args = parser.parse_args()
+
+    if not os.path.exists(config.EXPORT_DIR):
+        os.makedirs(config.EXPORT_DIR)
+
+    model = load_eager_model(torch.device('cpu'))
+    loader = calibration_loader(args.calibration_samples)
+
+    if "torchscript" in args.formats:
+        export_torchscript(model, config.TORCHSCRIPT_MODEL_PATH)
+    if "onnx" in args.formats:
+        export_onnx(model, config.ONNX_MODEL_PATH)
+    if "int8" in args.formats:
+        # prepare_fx rewrites the module in place; quantize a fresh copy
+        quantize_int8(load_eager_model(torch.device('cpu')), loader, config.INT8_MODEL_PATH)
+
+    if loader is not None:
+        report_accuracy(args.formats, loader)
+    else:
+        print("Warning: No labelled data found in data/raw; skipping IoU comparison.")
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,106 @@
 
-import os
 import cv2
 import torch
 import numpy as np
 
-import sys
-# Add current directory to path so imports work whether run as script or module
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
+# Absolute imports when run as a script from this directory, relative when
+# imported as part of the package (so config / the model registry are shared with api.py)
 try:
     import config
-    from model import DeepLabV3Plus
+    from model_registry import get_model, model_fingerprint
     from utils import polygonize_mask
+    from polygon_metrics import pack_polygons, polygon_metrics
+    from tiled_inference import predict_tiled, INFERENCE_MODES
+    from mask_codec import encode_mask, MASK_ENCODINGS
+    from dataset import RoofDataset
+    from metrics import SegmentationMetrics
+    from result_cache import ResultCache, cache_path, image_digest
 except ImportError:
     from . import config
-    from .model import DeepLabV3Plus
+    from .model_registry import get_model, model_fingerprint
     from .utils import polygonize_mask
+    from .polygon_metrics import pack_polygons, polygon_metrics
+    from .tiled_inference import predict_tiled, INFERENCE_MODES
+    from .mask_codec import encode_mask, MASK_ENCODINGS
+    from .dataset import RoofDataset
+    from .metrics import SegmentationMetrics
+    from .result_cache import ResultCache, cache_path, image_digest
 
 class RoofInferenceEngine:
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = DeepLabV3Plus(n_classes=config.NUM_CLASSES, backbone=config.BACKBONE).to(self.device)
-        
-        if os.path.exists(config.BEST_MODEL_PATH):
-            self.model.load_state_dict(torch.load(config.BEST_MODEL_PATH, map_location=self.device))
-            print("Model loaded from checkpoint.")
-        else:
-            print("Warning: No checkpoint found. Inference will use random weights.")
-            
-        self.model.eval() # Ensure eval mode for inference (fixes BatchNorm error with batch_size=1)
+    def __init__(self, runtime=None, optimize=None, compile=None):
+        """
+        runtime: 'eager', 'torchscript', 'int8' or 'onnx' (see runtime.py).
+        Defaults to config.INFERENCE_RUNTIME.
+        optimize / compile: BN folding + fused ASPP / torch.compile for the eager
+        runtime (see optimize.py). Default to config.INFERENCE_OPTIMIZE / INFERENCE_COMPILE.
+        """
+        self.runtime = runtime or config.INFERENCE_RUNTIME
+        # Shared with api.py (and other engines) through the registry
+        self.model, self.device = get_model(self.runtime, optimize=optimize, compile=compile)
+        # Results of repeated images, dropped when the checkpoint changes
+        self.cache = ResultCache("engine", lambda: model_fingerprint(self.runtime, optimize, compile),
+                                 db_path=cache_path(config.CACHE_DIR, config.RESULT_CACHE_PATH), memory_items=config.RESULT_CACHE_MEMORY_ITEMS)
+
+    def _predict_batch(self, batch):
+        """
+        Runs the model on a [B, C, H, W] tensor and returns [B, H, W] probabilities.
+        """
+        with torch.no_grad():
+            output = self.model(batch.to(self.device))
+            return torch.sigmoid(output)[:, 0].cpu().numpy()
 
-    def process_roof_image(self, image_path):
+    def process_roof_image(self, image_path, mode=None, mask_encoding=None):
         """
         Processes a single image file and returns segmentation metrics.
         Follows 'Master Prompt' specifications.
+        mode: 'tiled' (sliding window at native resolution) or 'resize'.
+        Defaults to config.INFERENCE_MODE.
+        mask_encoding: None (no mask in the result), 'rle', 'bitpack' or 'png'.
+        Decode with mask_codec.decode_mask.
         """
+        mode = mode or config.INFERENCE_MODE
+        if mode not in INFERENCE_MODES:
+            return {"error": f"Unknown inference mode: {mode}"}
+        if mask_encoding and mask_encoding not in MASK_ENCODINGS:
+            return {"error": f"Unknown mask encoding: {mask_encoding}"}
+        
         # 1. Load and Preprocess
         original_img = cv2.imread(image_path)
         if original_img is None:
             return {"error": "Image not found"}
             
+        # Same pixels + options with the same model -> cached result
+        cache_key = self.cache.key("engine", image_digest(original_img), mode, mask_encoding)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+            
         original_h, original_w = original_img.shape[:2]
-        
-        # Resize to Model Input Size (512x512)
-        # Note: Ideally we strictly slice, but for single image inference, resizing is common.
         img = cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB)
-        img_resized = cv2.resize(img, (config.INPUT_SIZE, config.INPUT_SIZE))
-        
-        img_tensor = img_resized.astype(np.float32) / 255.0
-        img_tensor = torch.from_numpy(img_tensor).permute(2, 0, 1).unsqueeze(0).to(self.device)
         
         # 2. Inference
-        with torch.no_grad():
-            output = self.model(img_tensor)
-            prob_map = torch.sigmoid(output).squeeze().cpu().numpy()
+        if mode == "tiled":
+            # Overlapping 512x512 tiles, blended back at full resolution
+            prob_map_original = predict_tiled(img, self._predict_batch, tile_size=config.INPUT_SIZE,
+                                              overlap=config.TILE_OVERLAP, batch_size=config.TILE_BATCH_SIZE)
             
-        # 3. Post-Processing
-        # Threshold
-        mask = (prob_map > 0.5).astype(np.uint8)
-        
-        # Resize mask back to original
-        mask_original = cv2.resize(mask, (original_w, original_h), interpolation=cv2.INTER_NEAREST)
+            # 3. Post-Processing
+            mask_original = (prob_map_original > 0.5).astype(np.uint8)
+        else:
+            # Resize to Model Input Size (512x512)
+            img_resized = cv2.resize(img, (config.INPUT_SIZE, config.INPUT_SIZE))
+            
+            img_tensor = img_resized.astype(np.float32) / 255.0
+            img_tensor = torch.from_numpy(img_tensor).permute(2, 0, 1).unsqueeze(0)
+            prob_map = self._predict_batch(img_tensor)[0]
+            
+            # 3. Post-Processing
+            # Threshold
+            mask = (prob_map > 0.5).astype(np.uint8)
+            
+            # Resize mask back to original
+            mask_original = cv2.resize(mask, (original_w, original_h), interpolation=cv2.INTER_NEAREST)
+            prob_map_original = cv2.resize(prob_map, (original_w, original_h))
         
         # 4. Vectorization (Ramer-Douglas-Peucker)
         # Using epsilon derived from config
@@ -70,26 +110,69 @@ class RoofInferenceEngine:
         area_pixels = np.sum(mask_original)
         # Confidence score (mean probability of foreground pixels)
         if area_pixels > 0:
-            prob_map_resized = cv2.resize(prob_map, (original_w, original_h))
-            score = np.mean(prob_map_resized[mask_original == 1])
+            score = np.mean(prob_map_original[mask_original == 1])
         else:
             score = 0.0
+        
+        # Per-polygon metrics (same order as vector_polygon), one vectorized pass
+        vertices, offsets = pack_polygons(polygons)
+        stats = polygon_metrics(vertices, offsets, prob_map=prob_map_original)
+        polygon_stats = [{
+            "area_pixels": float(stats["area"][i]),
+            "perimeter_pixels": round(float(stats["perimeter"][i]), 2),
+            "centroid": [round(float(v), 2) for v in stats["centroid"][i]],
+            "bbox": [int(v) for v in stats["bbox"][i]], # [min_x, min_y, max_x, max_y]
+            "confidence": round(float(stats["mean_probability"][i]), 4)
+        } for i in range(len(polygons))]
             
-        return {
-            "segmentation_mask": mask_original.tolist(), # Warning: Large object
+        result = {
             "vector_polygon": polygons,
+            "polygon_metrics": polygon_stats,
             "metrics": {
                 "area_pixels": int(area_pixels),
                 "confidence_score": float(score),
-                "model_architecture": "DeepLabv3+ (ResNet101 + ASPP Separable)"
+                "model_architecture": f"DeepLabv3+ ({config.BACKBONE} OS{config.OUTPUT_STRIDE} + ASPP Separable)",
+                "inference_mode": mode,
+                "runtime": self.runtime
             }
         }
+        
+        if mask_encoding:
+            result["segmentation_mask"] = encode_mask(mask_original, mask_encoding)
+        
+        self.cache.put(cache_key, result)
+        return result
+
+    def evaluate(self, image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, batch_size=config.TILE_BATCH_SIZE, limit=None):
+        """
+        Scores this runtime's predictions against labelled tiles (RoofDataset
+        layout) and returns SegmentationMetrics.compute().
+        """
+        dataset = RoofDataset(image_dir=image_dir, mask_dir=mask_dir, input_size=config.INPUT_SIZE)
+        if len(dataset) == 0:
+            return {"error": f"No labelled tiles found in {image_dir}"}
+        
+        count = len(dataset) if limit is None else min(limit, len(dataset))
+        metrics = SegmentationMetrics(n_classes=2)
+        for start in range(0, count, batch_size):
+            samples = [dataset[i] for i in range(start, min(start + batch_size, count))]
+            images = torch.stack([image for image, _ in samples])
+            masks = torch.stack([mask for _, mask in samples])
+            probs = self._predict_batch(images)
+            metrics.update(torch.from_numpy(probs > 0.5), masks)
+        return metrics.compute()
+
+# Global Instance (created on first use, not at import)
+_engine = None
 
-# Global Instance
-engine = RoofInferenceEngine()
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = RoofInferenceEngine()
+    return _engine
 
-def process_roof_image(image_path):
-    return engine.process_roof_image(image_path)
+def process_roof_image(image_path, mode=None, mask_encoding=None):
+    return get_engine().process_roof_image(image_path, mode=mode, mask_encoding=mask_encoding)
 
 if __name__ == "__main__":
     # Test
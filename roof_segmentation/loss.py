@@ -45,3 +45,93 @@ class FocalLoss(nn.Module):
             return torch.sum(F_loss)
         else:
             return F_loss
+
+class _FocalLossFunction(torch.autograd.Function):
+    """
+    Focal loss with a hand-written backward. Only the logits and targets are
+    saved for backward; BCE and pt are recomputed there, and both passes
+    update their buffers in place instead of allocating one tensor per op.
+    d/dx = alpha * (sigmoid(x) - y) * [(1-pt)^γ + γ * pt * BCE * (1-pt)^(γ-1)]
+    """
+    @staticmethod
+    def forward(ctx, inputs, targets, alpha, gamma, reduction):
+        ctx.save_for_backward(inputs, targets)
+        ctx.alpha, ctx.gamma, ctx.reduction = alpha, gamma, reduction
+
+        BCE = F.binary_cross_entropy_with_logits(inputs, targets, reduction='none')
+        # alpha * (1 - exp(-BCE))^γ * BCE, same operation order as FocalLoss
+        F_loss = torch.neg(BCE).exp_().neg_().add_(1).pow_(gamma).mul_(alpha).mul_(BCE)
+
+        if reduction == 'mean':
+            return F_loss.mean()
+        elif reduction == 'sum':
+            return F_loss.sum()
+        return F_loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        inputs, targets = ctx.saved_tensors
+        alpha, gamma = ctx.alpha, ctx.gamma
+
+        BCE = F.binary_cross_entropy_with_logits(inputs, targets, reduction='none')
+        pt = torch.neg(BCE).exp_()
+        one_minus_pt = torch.neg(pt).add_(1)
+
+        # γ * pt * BCE * (1-pt)^(γ-1) + (1-pt)^γ  (written into BCE)
+        if gamma == 0:
+            BCE.zero_()
+        else:
+            BCE.mul_(pt).mul_(gamma).mul_(one_minus_pt.pow(gamma - 1))
+        BCE.add_(one_minus_pt.pow_(gamma))
+        # * alpha * (sigmoid(x) - y), reusing the pt buffer
+        grad = torch.sigmoid(inputs, out=pt).sub_(targets).mul_(BCE).mul_(alpha)
+
+        if ctx.reduction == 'mean':
+            grad.mul_(grad_output / inputs.numel())
+        else:
+            grad.mul_(grad_output)
+        return grad, None, None, None, None
+
+class FusedFocalLoss(FocalLoss):
+    """
+    Drop-in FocalLoss (same forward values) that keeps no activation-sized
+    intermediates alive between forward and backward.
+    """
+    def forward(self, inputs, targets):
+        inputs = inputs.reshape(-1)
+        targets = targets.reshape(-1).to(inputs.dtype)
+        return _FocalLossFunction.apply(inputs, targets, self.alpha, self.gamma, self.reduction)
+
+def benchmark_focal_loss(batch_size=5, size=512, runs=10):
+    """
+    Forward + backward time and tensor bytes saved for backward,
+    FocalLoss vs FusedFocalLoss on [batch_size, 1, size, size] logits.
+    """
+    import time
+
+    logits = torch.randn(batch_size, 1, size, size)
+    targets = (torch.rand(batch_size, size, size) > 0.7).float()
+    results = {}
+    for name, criterion in (("FocalLoss", FocalLoss()), ("FusedFocalLoss", FusedFocalLoss())):
+        saved = []
+
+        def pack(tensor):
+            saved.append(tensor.untyped_storage().nbytes())
+            return tensor
+
+        x = logits.clone().requires_grad_()
+        with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+            criterion(x, targets).backward()
+
+        timings = []
+        for _ in range(runs):
+            x = logits.clone().requires_grad_()
+            start = time.perf_counter()
+            criterion(x, targets).backward()
+            timings.append((time.perf_counter() - start) * 1000.0)
+        results[name] = {"ms": sorted(timings)[len(timings) // 2], "saved_mb": sum(saved) / 1024 ** 2}
+    return results
+
+if __name__ == '__main__':
+    for name, r in benchmark_focal_loss().items():
+        print(f"{name:<15} {r['ms']:.1f} ms fwd+bwd, {r['saved_mb']:.1f} MB saved for backward")
@@ -0,0 +1,61 @@
+
+import base64
+import cv2
+import numpy as np
+
+MASK_ENCODINGS = ("rle", "bitpack", "png")
+
+def encode_mask(mask, encoding="rle"):
+    """
+    Encodes a binary [H, W] mask into a compact, JSON-serializable dict:
+    {"encoding": ..., "size": [H, W], "data": ...}
+    - rle:     COCO-style uncompressed RLE (column-major run lengths, starting
+               with a run of zeros). data is a list of ints.
+    - bitpack: 1 bit per pixel (row-major, np.packbits), base64 string.
+    - png:     single-channel PNG (0/255), base64 string.
+    """
+    mask = np.asarray(mask)
+    h, w = mask.shape[:2]
+    binary = mask > 0
+
+    if encoding == "rle":
+        flat = binary.ravel(order="F")
+        # Run boundaries: positions where the value changes
+        change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+        bounds = np.concatenate(([0], change, [flat.size]))
+        counts = np.diff(bounds)
+        if flat.size and flat[0]:
+            counts = np.concatenate(([0], counts)) # COCO RLE always starts with zeros
+        data = counts.tolist()
+    elif encoding == "bitpack":
+        data = base64.b64encode(np.packbits(binary.ravel()).tobytes()).decode("ascii")
+    elif encoding == "png":
+        ok, buf = cv2.imencode(".png", binary.astype(np.uint8) * 255)
+        if not ok:
+            raise ValueError("PNG encoding failed")
+        data = base64.b64encode(buf.tobytes()).decode("ascii")
+    else:
+        raise ValueError(f"Unknown mask encoding '{encoding}'. Options: {', '.join(MASK_ENCODINGS)}")
+
+    return {"encoding": encoding, "size": [int(h), int(w)], "data": data}
+
+def decode_mask(encoded):
+    """
+    Inverse of encode_mask. Returns a uint8 [H, W] mask of 0/1.
+    """
+    encoding = encoded["encoding"]
+    h, w = encoded["size"]
+
+    if encoding == "rle":
+        counts = np.asarray(encoded["data"], dtype=np.int64)
+        values = np.arange(len(counts)) % 2 # Runs alternate 0, 1, 0, ...
+        flat = np.repeat(values.astype(np.uint8), counts)
+        return flat.reshape((h, w), order="F")
+    elif encoding == "bitpack":
+        packed = np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.uint8)
+        return np.unpackbits(packed, count=h * w).reshape(h, w)
+    elif encoding == "png":
+        buf = np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.uint8)
+        return (cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE) > 0).astype(np.uint8)
+    else:
+        raise ValueError(f"Unknown mask encoding '{encoding}'. Options: {', '.join(MASK_ENCODINGS)}")
@@ -0,0 +1,124 @@
+
+import torch
+import torch.nn.functional as F
+
+try:
+    from distributed import all_reduce_sum
+except ImportError:
+    from .distributed import all_reduce_sum
+
+IMAGE_IOU_BINS = 20 # Per-image IoU histogram resolution (0.05 wide bins)
+
+def mask_boundary(mask):
+    """
+    1-pixel inner boundary of a [B, 1, H, W] float {0, 1} mask (mask minus its 3x3 erosion).
+    """
+    eroded = -F.max_pool2d(-mask, kernel_size=3, stride=1, padding=1)
+    return mask - eroded
+
+class SegmentationMetrics:
+    """
+    Streaming segmentation metrics for binary roof masks.
+    All accumulators are fixed-size tensors on the device, so update() never
+    syncs with the host and all_reduce() can sum them across DDP processes.
+      - confusion matrix (torch.bincount) -> global IoU / mIoU, precision, recall
+      - boundary matches within `boundary_tolerance` px -> boundary F-score
+      - per-image roof IoU (histogram + sum) -> mean / 10th percentile per image
+    """
+    def __init__(self, n_classes=2, device='cpu', boundary_tolerance=2):
+        self.n_classes = n_classes
+        self.device = torch.device(device)
+        self.boundary_tolerance = boundary_tolerance
+        self.reset()
+
+    def reset(self):
+        self.confusion = torch.zeros(self.n_classes * self.n_classes, dtype=torch.int64, device=self.device)
+        # pred boundary px matched, pred boundary px, gt boundary px matched, gt boundary px
+        self.boundary = torch.zeros(4, dtype=torch.int64, device=self.device)
+        # sum of per-image IoU, images with roof in pred or target
+        self.image_iou = torch.zeros(2, dtype=torch.float64, device=self.device)
+        self.image_hist = torch.zeros(IMAGE_IOU_BINS, dtype=torch.int64, device=self.device)
+
+    def update(self, preds, target):
+        """
+        preds, target: [B, H, W] integer class maps (0 background, 1 roof).
+        """
+        preds = preds.to(self.device).long()
+        target = target.to(self.device).long()
+
+        # 1. Confusion matrix (rows = target, cols = prediction)
+        idx = target.reshape(-1) * self.n_classes + preds.reshape(-1)
+        self.confusion += torch.bincount(idx, minlength=self.n_classes * self.n_classes)
+
+        # 2. Per-image roof IoU (images with no roof in either map are skipped)
+        p, t = preds == 1, target == 1
+        inter = (p & t).sum(dim=(1, 2))
+        union = (p | t).sum(dim=(1, 2))
+        valid = union > 0
+        iou = inter.double() / union.clamp(min=1).double()
+        self.image_iou += torch.stack([(iou * valid).sum(), valid.sum().double()])
+        bins = (iou * IMAGE_IOU_BINS).long().clamp(max=IMAGE_IOU_BINS - 1)
+        self.image_hist += torch.bincount(bins, weights=valid.double(), minlength=IMAGE_IOU_BINS).long()
+
+        # 3. Boundary matches within the tolerance band
+        k = 2 * self.boundary_tolerance + 1
+        pred_b = mask_boundary(p.unsqueeze(1).float())
+        gt_b = mask_boundary(t.unsqueeze(1).float())
+        pred_band = F.max_pool2d(pred_b, kernel_size=k, stride=1, padding=self.boundary_tolerance)
+        gt_band = F.max_pool2d(gt_b, kernel_size=k, stride=1, padding=self.boundary_tolerance)
+        self.boundary += torch.stack([
+            (pred_b * gt_band).sum(), pred_b.sum(),
+            (gt_b * pred_band).sum(), gt_b.sum()
+        ]).long()
+
+    def update_logits(self, logits, target, threshold=0.5):
+        """
+        Convenience for model outputs: logits [B, 1, H, W], target [B, H, W].
+        """
+        self.update((torch.sigmoid(logits.float()) > threshold).squeeze(1), target)
+
+    def all_reduce(self):
+        """
+        Sums the accumulators across DDP processes (no-op when single-process).
+        """
+        for tensor in (self.confusion, self.boundary, self.image_iou, self.image_hist):
+            all_reduce_sum(tensor)
+
+    def compute(self):
+        """
+        Epoch-end summary (the only host sync).
+        """
+        cm = self.confusion.view(self.n_classes, self.n_classes).double().cpu()
+        tp = cm.diag()
+        fp = cm.sum(dim=0) - tp
+        fn = cm.sum(dim=1) - tp
+        iou = tp / (tp + fp + fn).clamp(min=1)
+
+        precision = (tp[1] / (tp[1] + fp[1]).clamp(min=1)).item()
+        recall = (tp[1] / (tp[1] + fn[1]).clamp(min=1)).item()
+
+        b = self.boundary.double().cpu()
+        b_precision = (b[0] / b[1].clamp(min=1)).item()
+        b_recall = (b[2] / b[3].clamp(min=1)).item()
+
+        image_iou = self.image_iou.cpu()
+        hist = self.image_hist.cpu()
+        images = int(image_iou[1].item())
+        p10 = float('nan')
+        if images > 0:
+            # Upper edge of the bin containing the 10th percentile
+            p10 = (torch.searchsorted(hist.cumsum(0), max(1, round(0.1 * images))).item() + 1) / IMAGE_IOU_BINS
+
+        return {
+            "miou": iou.mean().item(),
+            "roof_iou": iou[1].item(),
+            "background_iou": iou[0].item(),
+            "pixel_accuracy": (tp.sum() / cm.sum().clamp(min=1)).item(),
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0,
+            "boundary_f": 2 * b_precision * b_recall / (b_precision + b_recall) if b_precision + b_recall > 0 else 0.0,
+            "image_roof_iou_mean": (image_iou[0] / image_iou[1]).item() if images > 0 else float('nan'),
+            "image_roof_iou_p10": p10,
+            "images": images
+        }
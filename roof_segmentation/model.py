@@ -68,18 +68,62 @@ class ASPP(nn.Module):
         res = torch.cat(res, dim=1)
         return self.project(res)
 
+# Backbone -> (constructor, ImageNet weights, low-level channels, high-level channels)
+BACKBONES = {
+    'resnet18': (models.resnet18, models.ResNet18_Weights.DEFAULT, 64, 512),
+    'resnet34': (models.resnet34, models.ResNet34_Weights.DEFAULT, 64, 512),
+    'resnet50': (models.resnet50, models.ResNet50_Weights.DEFAULT, 256, 2048),
+    'resnet101': (models.resnet101, models.ResNet101_Weights.DEFAULT, 256, 2048),
+    'mobilenet_v3_large': (models.mobilenet_v3_large, models.MobileNet_V3_Large_Weights.DEFAULT, 24, 960),
+}
+
+# Output stride -> ASPP atrous rates (DeepLabv3 paper: rates double when OS halves).
+# OS32 (no dilation) keeps the original model's rates, so its checkpoints load unchanged.
+ASPP_RATES = {8: [12, 24, 36], 16: [6, 12, 18], 32: [6, 12, 18]}
+
+def dilate_stage(blocks, dilation, previous_dilation=1):
+    """
+    Removes the stride-2 downsampling of a backbone stage and dilates its
+    spatial convolutions instead (keeps the receptive field, raises resolution).
+    The first block keeps the previous dilation, as in torchvision's ResNet.
+    Works for ResNet BasicBlock/Bottleneck layers and MobileNetV3 feature blocks.
+    """
+    for i, block in enumerate(blocks):
+        d = previous_dilation if i == 0 else dilation
+        for m in block.modules():
+            if isinstance(m, nn.Conv2d):
+                if m.stride == (2, 2):
+                    m.stride = (1, 1)
+                k = m.kernel_size[0]
+                if k > 1:
+                    m.dilation = (d, d)
+                    m.padding = ((k - 1) // 2 * d, (k - 1) // 2 * d)
+
 class DeepLabV3Plus(nn.Module):
     """
     DeepLabv3+ Architecture (State-of-the-Art Configuration).
-    Backbone: ResNet101 (Modified for OS=16)
+    Backbone: ResNet18/34/50/101 or MobileNetV3-Large (see BACKBONES), dilated to output_stride (8/16;
+    32 is the plain backbone)
     Decoder: Upsampled Features + Low Level Features
+    pretrained: initialize the backbone with ImageNet weights (downloaded on first use).
     """
-    def __init__(self, n_classes=1, backbone='resnet101'):
+    def __init__(self, n_classes=1, backbone='resnet101', output_stride=32, pretrained=True):
         super(DeepLabV3Plus, self).__init__()
         
+        if backbone not in BACKBONES:
+            raise NotImplementedError(f"Backbone '{backbone}' is not supported. Options: {', '.join(BACKBONES)}")
+        if output_stride not in ASPP_RATES:
+            raise ValueError(f"output_stride must be one of {sorted(ASPP_RATES)}")
+        
+        constructor, weights, self.low_level_features_channels, self.high_level_features_channels = BACKBONES[backbone]
+        
+        if not pretrained:
+            weights = None
+        
         # --- Encoder (Backbone) ---
-        if backbone == 'resnet101':
-            full_resnet = models.resnet101(weights=models.ResNet101_Weights.DEFAULT)
+        # initial + layer1 -> low-level features (stride 4); layer2..4 -> high-level features
+        if backbone.startswith('resnet'):
+            full_resnet = constructor(weights=weights)
             
             self.initial = nn.Sequential(
                 full_resnet.conv1,
@@ -91,14 +135,23 @@ class DeepLabV3Plus(nn.Module):
             self.layer2 = full_resnet.layer2
             self.layer3 = full_resnet.layer3
             self.layer4 = full_resnet.layer4 
-            
-            self.low_level_features_channels = 256
-            self.high_level_features_channels = 2048
         else:
-            raise NotImplementedError("Only ResNet101 is supported implementation.")
+            features = constructor(weights=weights).features
+            
+            self.initial = features[:4] # Stride 4, 24 channels
+            self.layer1 = nn.Identity() # Low-level features
+            self.layer2 = features[4:7] # Stride 8
+            self.layer3 = features[7:13] # Stride 16
+            self.layer4 = features[13:] # Stride 32, 960 channels
+            
+        if output_stride == 16:
+            dilate_stage(self.layer4, 2)
+        elif output_stride == 8:
+            dilate_stage(self.layer3, 2)
+            dilate_stage(self.layer4, 4, previous_dilation=2)
             
         # --- ASPP ---
-        self.aspp = ASPP(self.high_level_features_channels)
+        self.aspp = ASPP(self.high_level_features_channels, atrous_rates=ASPP_RATES[output_stride])
         
         # --- Decoder ---
         # 1x1 Conv to reduce low-level channels
@@ -0,0 +1,97 @@
+
+import time
+import threading
+
+try:
+    import config
+    from runtime import load_model, runtime_device, runtime_path
+    from optimize import optimize_for_inference
+    from result_cache import file_fingerprint
+except ImportError:
+    from . import config
+    from .runtime import load_model, runtime_device, runtime_path
+    from .optimize import optimize_for_inference
+    from .result_cache import file_fingerprint
+
+# Loaded models, keyed by (runtime, optimize, compile). Shared by api.py and
+# inference_engine.py so the weights are only loaded once per process.
+_models = {}
+_stats = {}
+_fingerprints = {}
+_lock = threading.Lock()
+
+def model_key(runtime=None, optimize=None, compile=None):
+    """
+    Registry key (runtime, optimized, compiled) with config defaults applied.
+    """
+    runtime = runtime or config.INFERENCE_RUNTIME
+    optimize = config.INFERENCE_OPTIMIZE if optimize is None else optimize
+    compile = config.INFERENCE_COMPILE if compile is None else compile
+    if runtime != "eager":
+        optimize = compile = False
+    return (runtime, bool(optimize or compile), bool(compile))
+
+def source_fingerprint(runtime):
+    """
+    Version id of the files a runtime loads: config.BEST_MODEL_PATH, plus the
+    exported artifact for non-eager runtimes.
+    """
+    fingerprint = f"{config.BACKBONE}:OS{config.OUTPUT_STRIDE}:{file_fingerprint(config.BEST_MODEL_PATH)}"
+    if runtime != "eager":
+        fingerprint += ":" + file_fingerprint(runtime_path(runtime))
+    return fingerprint
+
+def get_model(runtime=None, optimize=None, compile=None):
+    """
+    Returns (model, device), loading it on first use.
+    runtime defaults to config.INFERENCE_RUNTIME; optimize / compile (eager only,
+    see optimize.py) default to config.INFERENCE_OPTIMIZE / INFERENCE_COMPILE.
+    """
+    key = model_key(runtime, optimize, compile)
+    runtime, optimize, compile = key
+
+    with _lock:
+        if key not in _models:
+            start = time.perf_counter()
+            # Taken before loading, so a checkpoint replaced mid-load is not mistaken for the loaded one
+            fingerprint = source_fingerprint(runtime)
+            device = runtime_device(runtime)
+            model = load_model(runtime, device)
+            if optimize or compile:
+                batch_sizes = sorted({1, config.TILE_BATCH_SIZE, config.BATCH_MAX_SIZE})
+                model = optimize_for_inference(model, device, compile=compile, batch_sizes=batch_sizes)
+            elapsed = time.perf_counter() - start
+
+            _models[key] = (model, device)
+            _fingerprints[key] = fingerprint
+            _stats[describe(key)] = {"device": str(device), "cold_start_seconds": round(elapsed, 3)}
+            print(f"Model ready in {elapsed:.2f}s ({describe(key)} on {device})")
+        return _models[key]
+
+def model_fingerprint(runtime=None, optimize=None, compile=None):
+    """
+    Identifies the predictions a model gives, for keying cached results: the
+    variant plus config.BEST_MODEL_PATH (and the runtime artifact) as it is on
+    disk. The same in every process sharing the files, loaded or not, so
+    serve.py workers, the engine and batch_quote share one result cache.
+    A process still running weights older than the file on disk gets a
+    distinct value, so its results are never filed under the new checkpoint.
+    """
+    key = model_key(runtime, optimize, compile)
+    fingerprint = f"{describe(key)}|{source_fingerprint(key[0])}"
+    with _lock:
+        loaded = _fingerprints.get(key)
+    if loaded is not None and loaded != source_fingerprint(key[0]):
+        fingerprint += f"|stale:{loaded}"
+    return fingerprint
+
+def describe(key):
+    runtime, optimized, compiled = key
+    return runtime + ("+compiled" if compiled else "+optimized" if optimized else "")
+
+def stats():
+    """
+    Cold-start time of every model loaded so far.
+    """
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,152 @@
+
+import copy
+import time
+import argparse
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+try:
+    import config
+except ImportError:
+    from . import config
+
+def fold_conv_bn(conv, bn):
+    """
+    Returns a Conv2d equal to bn(conv(x)) in eval mode:
+    W' = W * γ / sqrt(var + eps),  b' = (b - mean) * γ / sqrt(var + eps) + β
+    """
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride,
+                      conv.padding, conv.dilation, conv.groups, bias=True, padding_mode=conv.padding_mode)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    with torch.no_grad():
+        fused.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return fused.to(conv.weight.device)
+
+def fold_batchnorm(module):
+    """
+    Folds every BatchNorm2d that directly follows a Conv2d into that conv
+    (in place) and replaces the BatchNorm with Identity. Covers nn.Sequential
+    blocks (ASPP, decoder, ResNet downsample, MobileNetV3 Conv2dNormActivation),
+    ResNet blocks (convN -> bnN) and SeparableConv2d (pointwise -> bn).
+    """
+    for child in module.children():
+        fold_batchnorm(child)
+
+    if isinstance(module, nn.Sequential):
+        for i in range(len(module) - 1):
+            if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d):
+                module[i] = fold_conv_bn(module[i], module[i + 1])
+                module[i + 1] = nn.Identity()
+
+    for conv_name, bn_name in (("conv1", "bn1"), ("conv2", "bn2"), ("conv3", "bn3"), ("pointwise", "bn")):
+        conv, bn = getattr(module, conv_name, None), getattr(module, bn_name, None)
+        if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+            setattr(module, conv_name, fold_conv_bn(conv, bn))
+            setattr(module, bn_name, nn.Identity())
+    return module
+
+class FusedASPP(nn.Module):
+    """
+    Inference form of a BN-folded ASPP. The image pooling branch is a 1x1 map,
+    so after bilinear upsampling it is constant over space; its slice of the
+    projection conv is applied on the 1x1 map and added as a per-image bias.
+    This drops the interpolate and shrinks the concat to the four spatial
+    branches, leaving conv -> cat -> conv + bias -> relu for the compiler to fuse.
+    """
+    def __init__(self, aspp):
+        super(FusedASPP, self).__init__()
+        self.branches = nn.ModuleList(aspp.convs[:-1])
+        self.pooling = aspp.convs[-1] # AdaptiveAvgPool2d -> conv (BN folded) -> ReLU
+
+        project = aspp.project[0]
+        pool_channels = self.pooling[1].out_channels
+        split = project.in_channels - pool_channels
+        self.project = nn.Conv2d(split, project.out_channels, 1, bias=True)
+        self.pool_project = nn.Conv2d(pool_channels, project.out_channels, 1, bias=False)
+        with torch.no_grad():
+            self.project.weight.copy_(project.weight[:, :split])
+            self.project.bias.copy_(project.bias)
+            self.pool_project.weight.copy_(project.weight[:, split:])
+        self.to(project.weight.device)
+
+    def forward(self, x):
+        pooled = self.pool_project(self.pooling(x)) # [B, C, 1, 1], broadcast over H, W
+        x = torch.cat([branch(x) for branch in self.branches], dim=1)
+        return F.relu(self.project(x) + pooled) # Dropout is identity at inference
+
+def warmup(model, device, batch_sizes=(1, config.TILE_BATCH_SIZE), input_size=config.INPUT_SIZE):
+    """
+    Runs the model once per input shape so compilation / allocator warm-up
+    happens at startup rather than on the first requests.
+    """
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            model(torch.rand(batch_size, 3, input_size, input_size, device=device))
+
+def optimize_for_inference(model, device, compile=False, batch_sizes=(1, config.TILE_BATCH_SIZE)):
+    """
+    Inference build of a trained DeepLabV3Plus (the original is left untouched):
+    BatchNorm folded into the preceding convs, FusedASPP, and optionally
+    torch.compile (config.COMPILE_MODE), warmed up on `batch_sizes`.
+    Falls back to the uncompiled model if compilation fails.
+    """
+    optimized = fold_batchnorm(copy.deepcopy(model).eval())
+    optimized.aspp = FusedASPP(optimized.aspp)
+    if compile:
+        try:
+            compiled = torch.compile(optimized, mode=config.COMPILE_MODE)
+            warmup(compiled, device, batch_sizes)
+            return compiled
+        except Exception as e:
+            print(f"Warning: torch.compile failed ({e}). Using the uncompiled optimized model.")
+    warmup(optimized, device, batch_sizes)
+    return optimized
+
+def measure(model, x, runs):
+    timings = []
+    with torch.no_grad():
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(x)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    return sorted(timings)[len(timings) // 2]
+
+def main():
+    try:
+        from runtime import load_eager_model
+    except ImportError:
+        from .runtime import load_eager_model
+
+    parser = argparse.ArgumentParser(description="Benchmark the optimized inference build against eager model.eval().")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--compile", action="store_true", help="Also benchmark torch.compile")
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    eager = load_eager_model(device)
+    x = torch.rand(args.batch_size, 3, config.INPUT_SIZE, config.INPUT_SIZE, device=device)
+    with torch.no_grad():
+        reference = eager(x)
+
+    variants = [("eager", eager), ("folded", optimize_for_inference(eager, device, batch_sizes=(args.batch_size,)))]
+    if args.compile:
+        start = time.perf_counter()
+        compiled = optimize_for_inference(eager, device, compile=True, batch_sizes=(args.batch_size,))
+        print(f"Compile + warm-up: {time.perf_counter() - start:.1f} s")
+        variants.append(("compiled", compiled))
+
+    print(f"\nDeepLabV3Plus ({config.BACKBONE} OS{config.OUTPUT_STRIDE}) batch {args.batch_size} @ {config.INPUT_SIZE}px on {device}\n")
+    print("| Variant | Latency (ms) | Max |Δ logit| |")
+    print("| :--- | ---: | ---: |")
+    for name, model in variants:
+        latency = measure(model, x, args.runs)
+        with torch.no_grad():
+            diff = (model(x) - reference).abs().max().item()
+        print(f"| {name} | {latency:.0f} | {diff:.2e} |")
+
+if __name__ == '__main__':
+    main()
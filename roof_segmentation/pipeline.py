@@ -0,0 +1,194 @@
+
+import time
+import asyncio
+import cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import config
+    from utils import fetch_satellite_mosaic, mosaic_window, segment_roof_from_center, segment_roof_from_mask, pixels_to_latlng, calculate_polygon_area
+    from projection import pixel_area_to_m2
+except ImportError:
+    from . import config
+    from .utils import fetch_satellite_mosaic, mosaic_window, segment_roof_from_center, segment_roof_from_mask, pixels_to_latlng, calculate_polygon_area
+    from .projection import pixel_area_to_m2
+
+# model: DeepLabV3Plus on the mosaic, component under the click
+# floodfill: colour flood fill from the click (no model, fast path)
+SEGMENT_METHODS = ("model", "floodfill")
+
+class PipelineError(Exception):
+    """
+    A request that ends early; carries the HTTP status the API should return.
+    """
+    def __init__(self, message, status_code):
+        super(PipelineError, self).__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def build_segment_result(pixel_polygon, bbox, img_shape):
+    """
+    Pixel polygon -> /segment response body (lat/lng polygon + footprint area).
+    """
+    geo_polygon = pixels_to_latlng(pixel_polygon, bbox, img_shape)
+    area_m2 = pixel_area_to_m2(calculate_polygon_area(pixel_polygon), pixel_polygon, bbox, img_shape)
+    return {
+        "roofSegmentStats": [{"boundingPolygon": geo_polygon}],
+        "solarPotential": {
+            "wholeRoofStats": {
+                "areaMeters2": round(area_m2, 2) # 2D footprint (no pitch correction)
+            }
+        }
+    }
+
+class SegmentPipeline:
+    """
+    Staged /segment pipeline that keeps blocking work off the event loop:
+      fetch   -> tile mosaic (network + tile cache) on the IO thread pool
+      infer   -> (model method) predict(image) coroutine, e.g. the API's batched model
+      segment -> component under the click / flood fill on the bounded CPU thread pool
+      project -> lat/lng polygon + area on the CPU thread pool
+    Each stage has its own timeout (504). At most max_inflight requests are in
+    the pipeline; further requests are rejected with 503 instead of queueing.
+    A timed-out stage is abandoned, but its thread finishes in the background,
+    so the pools' sizes also bound the work left running.
+    With a ResultCache, repeated clicks (same mosaic and click pixel) skip all stages.
+    """
+    def __init__(self, predict=None, cache=None, io_workers=config.SEGMENT_IO_WORKERS, cpu_workers=config.SEGMENT_CPU_WORKERS,
+                 max_inflight=config.SEGMENT_MAX_INFLIGHT, fetch_timeout=config.SEGMENT_FETCH_TIMEOUT,
+                 cpu_timeout=config.SEGMENT_CPU_TIMEOUT, infer_timeout=config.SEGMENT_INFER_TIMEOUT):
+        """
+        predict: async fn(rgb_image) -> (mask, prob_map) used by the model
+        method. Without it, every request uses flood fill.
+        cache: optional result_cache.ResultCache for finished responses.
+        """
+        self.predict = predict
+        self.cache = cache
+        self.infer_timeout = infer_timeout
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="segment-io")
+        self.cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="segment-cpu")
+        self.max_inflight = max_inflight
+        self.fetch_timeout = fetch_timeout
+        self.cpu_timeout = cpu_timeout
+
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._stats = {"completed": 0, "cached": 0, "rejected": 0, "failed": 0, "timeouts": {}, "stage_ms": {}, "stage_calls": {}}
+
+    async def run_stage(self, name, pool, fn, *args, timeout=None):
+        """
+        Runs fn(*args) on `pool` without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts", name)
+            raise PipelineError(f"Timed out in stage '{name}' after {timeout}s", 504)
+        finally:
+            self._record(name, start)
+
+    async def run_async_stage(self, name, coro, timeout=None):
+        """
+        Awaits a coroutine stage (already non-blocking) with the same timeout / stats handling.
+        """
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts", name)
+            raise PipelineError(f"Timed out in stage '{name}' after {timeout}s", 504)
+        finally:
+            self._record(name, start)
+
+    def cache_key(self, lat, lng, method):
+        """
+        Result cache key of a click: the mosaic it falls in and its pixel there.
+        """
+        x0, y0, click_pixel = mosaic_window(lat, lng)
+        return self.cache.key("segment", method, config.MOSAIC_SIZE, x0, y0, click_pixel)
+
+    async def segment(self, lat, lng, method="model"):
+        """
+        Returns the /segment response body or raises PipelineError.
+        method: 'model' or 'floodfill' (see SEGMENT_METHODS).
+        """
+        if self.predict is None:
+            method = "floodfill"
+        
+        # Cached answer for the same tile block and click pixel (no fetch, no inference)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache_key(lat, lng, method)
+            result = await self.cache.aget(cache_key)
+            if result is not None:
+                with self._lock:
+                    self._stats["cached"] += 1
+                return result
+        
+        # Backpressure: reject rather than let the queue (and latency) grow unbounded
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                self._stats["rejected"] += 1
+                raise PipelineError("Server busy, retry shortly", 503)
+            self.inflight += 1
+        try:
+            # 1. Fetch Tiles (NxN mosaic around the click, so roofs crossing tile edges stay whole)
+            image, bbox, click_pixel = await self.run_stage("fetch", self.io_pool, fetch_satellite_mosaic, lat, lng,
+                                                            timeout=self.fetch_timeout)
+            if image is None:
+                raise PipelineError("Failed to fetch satellite tile", 500)
+
+            # 2. Segment from the exact clicked pixel
+            if method == "model":
+                # Model stage: tile colour is BGR, the model expects RGB
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                mask, _ = await self.run_async_stage("infer", self.predict(rgb), timeout=self.infer_timeout)
+                pixel_polygon = await self.run_stage("segment", self.cpu_pool, segment_roof_from_mask, mask, click_pixel,
+                                                     timeout=self.cpu_timeout)
+            else:
+                pixel_polygon = await self.run_stage("segment", self.cpu_pool, segment_roof_from_center, image, click_pixel,
+                                                     timeout=self.cpu_timeout)
+            if len(pixel_polygon) == 0:
+                raise PipelineError("No roof segments detected", 404)
+
+            # 3. GeoCoords + area
+            result = await self.run_stage("project", self.cpu_pool, build_segment_result, pixel_polygon, bbox, image.shape,
+                                          timeout=self.cpu_timeout)
+            if cache_key is not None:
+                await self.cache.aput(cache_key, result)
+            with self._lock:
+                self._stats["completed"] += 1
+            return result
+        except PipelineError:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def _record(self, name, start):
+        with self._lock:
+            self._stats["stage_ms"][name] = self._stats["stage_ms"].get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+            self._stats["stage_calls"][name] = self._stats["stage_calls"].get(name, 0) + 1
+
+    def _count(self, key, name):
+        with self._lock:
+            self._stats[key][name] = self._stats[key].get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            stage_mean_ms = {name: self._stats["stage_ms"][name] / calls for name, calls in self._stats["stage_calls"].items()}
+            return {
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "completed": self._stats["completed"],
+                "cached": self._stats["cached"],
+                "rejected": self._stats["rejected"],
+                "failed": self._stats["failed"],
+                "timeouts": dict(self._stats["timeouts"]),
+                "stage_mean_ms": stage_mean_ms
+            }
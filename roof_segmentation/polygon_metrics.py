@@ -0,0 +1,122 @@
+
+import itertools
+import numpy as np
+import cv2
+
+# Metrics for many polygons at once. Polygons are stored as a ragged array:
+#   vertices: (V, 2) float [x, y] of all polygons, concatenated
+#   offsets:  (P + 1,) int, polygon i is vertices[offsets[i]:offsets[i + 1]]
+# Every metric is one NumPy pass over the vertices (no per-vertex Python loop).
+
+def pack_polygons(polygons):
+    """
+    List of polygons (each a list / array of [x, y]) -> (vertices, offsets).
+    """
+    counts = np.array([len(p) for p in polygons], dtype=np.int64)
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    # One conversion for all vertices rather than one array per polygon
+    vertices = np.array(list(itertools.chain.from_iterable(polygons)), dtype=np.float64).reshape(-1, 2)
+    return vertices, offsets
+
+def polygon_index(offsets):
+    """
+    (V,) index of the polygon each vertex belongs to.
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def next_vertex(offsets):
+    """
+    (V,) index of the following vertex of the same polygon (last -> first).
+    """
+    nxt = np.arange(1, offsets[-1] + 1)
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+    return nxt
+
+def polygon_metrics(vertices, offsets, prob_map=None):
+    """
+    Area (shoelace), perimeter, area centroid and bounding box of every polygon,
+    in pixel units. With prob_map (model probabilities at the polygons' pixel
+    coordinates), also the mean probability inside each polygon.
+    Returns a dict of arrays: area (P,), perimeter (P,), centroid (P, 2),
+    bbox (P, 4) as [min_x, min_y, max_x, max_y], mean_probability (P,).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n = len(offsets) - 1
+    ids = polygon_index(offsets)
+    counts = np.diff(offsets)
+
+    x, y = vertices[:, 0], vertices[:, 1]
+    nxt = next_vertex(offsets)
+    x1, y1 = x[nxt], y[nxt]
+
+    # 1. Shoelace: signed area from the cross products of consecutive vertices
+    cross = x * y1 - x1 * y
+    signed_area = np.bincount(ids, weights=cross, minlength=n) / 2.0
+
+    # 2. Perimeter: closed outline, last vertex back to the first
+    perimeter = np.bincount(ids, weights=np.hypot(x1 - x, y1 - y), minlength=n)
+
+    # 3. Area centroid; degenerate polygons (zero area) use the vertex mean
+    centroid = np.full((n, 2), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cx = np.bincount(ids, weights=(x + x1) * cross, minlength=n) / (6.0 * signed_area)
+        cy = np.bincount(ids, weights=(y + y1) * cross, minlength=n) / (6.0 * signed_area)
+        mean_x = np.bincount(ids, weights=x, minlength=n) / counts
+        mean_y = np.bincount(ids, weights=y, minlength=n) / counts
+    degenerate = signed_area == 0
+    centroid[:, 0] = np.where(degenerate, mean_x, cx)
+    centroid[:, 1] = np.where(degenerate, mean_y, cy)
+
+    # 4. Bounding boxes (reduceat over non-empty polygons only)
+    bbox = np.full((n, 4), np.nan)
+    nonempty = counts > 0
+    if nonempty.any():
+        starts = offsets[:-1][nonempty]
+        bbox[nonempty, 0] = np.minimum.reduceat(x, starts)
+        bbox[nonempty, 1] = np.minimum.reduceat(y, starts)
+        bbox[nonempty, 2] = np.maximum.reduceat(x, starts)
+        bbox[nonempty, 3] = np.maximum.reduceat(y, starts)
+
+    metrics = {
+        "area": np.abs(signed_area),
+        "perimeter": perimeter,
+        "centroid": centroid,
+        "bbox": bbox
+    }
+    if prob_map is not None:
+        metrics["mean_probability"] = mean_probability(vertices, offsets, prob_map)
+    return metrics
+
+def mean_probability(vertices, offsets, prob_map):
+    """
+    Mean of prob_map over the pixels inside each polygon (0 if it covers none).
+    The polygons are rasterized into one label image (polygon i -> i + 1) and
+    averaged with a single bincount; where polygons overlap the later one wins.
+    """
+    n = len(offsets) - 1
+    if n == 0 or len(vertices) == 0:
+        return np.zeros(n)
+
+    # Only the window covering all polygons is rasterized
+    h, w = prob_map.shape[:2]
+    points = np.round(vertices).astype(np.int32)
+    x0, y0 = np.clip(points.min(axis=0), 0, [w - 1, h - 1])
+    x1, y1 = np.clip(points.max(axis=0) + 1, 1, [w, h])
+    window = prob_map[y0:y1, x0:x1]
+    points = (points - [x0, y0]).astype(np.int32)
+
+    labels = np.zeros(window.shape[:2], dtype=np.int32)
+    for i in range(n):
+        if offsets[i + 1] - offsets[i] >= 3:
+            cv2.fillPoly(labels, [points[offsets[i]:offsets[i + 1]]], i + 1)
+
+    # Only covered pixels go through bincount
+    inside = labels > 0
+    covered = labels[inside]
+    sums = np.bincount(covered, weights=window[inside], minlength=n + 1)[1:]
+    pixels = np.bincount(covered, minlength=n + 1)[1:]
+    return np.where(pixels > 0, sums / np.maximum(pixels, 1), 0.0)
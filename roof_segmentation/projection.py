@@ -0,0 +1,73 @@
+
+import numpy as np
+
+# Web Mercator (EPSG:3857) sphere radius
+EARTH_RADIUS_M = 6378137.0
+
+def lat_to_mercator_y(lat_deg):
+    """
+    Latitude -> normalized Mercator y in [0, 1] (0 = north edge), the same
+    formula as utils.deg2num without the zoom scaling. Accepts arrays.
+    """
+    lat_rad = np.radians(lat_deg)
+    return (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0
+
+def mercator_y_to_lat(y):
+    """
+    Inverse of lat_to_mercator_y. Accepts arrays.
+    """
+    return np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y))))
+
+def pixels_to_latlng_array(pixels, bbox, img_shape):
+    """
+    Converts an (N, 2) array of [x, y] pixel coordinates inside an image covering
+    bbox into an (N, 2) array of [lat, lng].
+    Longitude is linear in x; latitude is linear in Mercator y (not in degrees).
+    """
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    img_h, img_w = img_shape[:2]
+
+    y_north = lat_to_mercator_y(bbox["north"])
+    y_south = lat_to_mercator_y(bbox["south"])
+
+    lng = bbox["west"] + pixels[:, 0] / img_w * (bbox["east"] - bbox["west"])
+    lat = mercator_y_to_lat(y_north + pixels[:, 1] / img_h * (y_south - y_north))
+    return np.stack([lat, lng], axis=1)
+
+def latlng_to_pixels_array(latlng, bbox, img_shape):
+    """
+    Converts an (N, 2) array of [lat, lng] into (N, 2) float [x, y] pixel
+    coordinates of an image covering bbox. Inverse of pixels_to_latlng_array.
+    """
+    latlng = np.asarray(latlng, dtype=np.float64).reshape(-1, 2)
+    img_h, img_w = img_shape[:2]
+
+    y_north = lat_to_mercator_y(bbox["north"])
+    y_south = lat_to_mercator_y(bbox["south"])
+
+    x = (latlng[:, 1] - bbox["west"]) / (bbox["east"] - bbox["west"]) * img_w
+    y = (lat_to_mercator_y(latlng[:, 0]) - y_north) / (y_south - y_north) * img_h
+    return np.stack([x, y], axis=1)
+
+def meters_per_pixel(lat_deg, bbox, img_shape):
+    """
+    Ground resolution (metres per pixel) at lat_deg for an image covering bbox.
+    Mercator pixels are square on the ground, so one value serves both axes.
+    """
+    img_w = img_shape[1]
+    deg_per_px = (bbox["east"] - bbox["west"]) / img_w
+    return EARTH_RADIUS_M * np.cos(np.radians(lat_deg)) * np.radians(deg_per_px)
+
+def meters_per_pixel_at_zoom(lat_deg, zoom, tile_size=256):
+    """
+    Ground resolution of a standard XYZ tile pyramid at zoom.
+    """
+    return 2.0 * np.pi * EARTH_RADIUS_M * np.cos(np.radians(lat_deg)) / (tile_size * 2.0 ** zoom)
+
+def pixel_area_to_m2(area_pixels, pixels, bbox, img_shape):
+    """
+    Converts an area measured in pixels into square metres, using the ground
+    resolution at the mean latitude of the given (N, 2) pixel coordinates.
+    """
+    lat = pixels_to_latlng_array(np.mean(np.asarray(pixels, dtype=np.float64).reshape(-1, 2), axis=0), bbox, img_shape)[0, 0]
+    return float(area_pixels * meters_per_pixel(lat, bbox, img_shape) ** 2)
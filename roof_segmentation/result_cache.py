@@ -0,0 +1,169 @@
+
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def file_fingerprint(path):
+    """
+    Cheap version id of a model file: path, size and modification time.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{path}:missing"
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+def cache_path(cache_dir, path):
+    """
+    Resolves a *_CACHE_PATH setting: relative paths live under cache_dir,
+    None (disk tier disabled) stays None.
+    """
+    return os.path.join(cache_dir, path) if path else None
+
+def image_digest(image):
+    """
+    sha256 of a decoded image (shape + pixels), so re-encoded uploads of the
+    same photo hit the cache even when their file bytes differ.
+    """
+    h = hashlib.sha256()
+    h.update(str(image.shape).encode())
+    h.update(image if image.flags["C_CONTIGUOUS"] else image.tobytes())
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    Two-level cache for prediction results (e.g. the /predict GeoJSON).
+    Keys are built from the request (image digest or tile window + options);
+    entries are tagged with fingerprint_fn() (see model_registry.model_fingerprint),
+    so results of an older checkpoint are never served: when the fingerprint
+    changes, the memory tier is dropped, and disk rows are only read back for
+    the current fingerprint. Rows of other fingerprints are left in place
+    (other processes sharing the file may still be on them) and are
+    overwritten as the same keys are recomputed.
+    Level 1: in-memory LRU of serialized results.
+    Level 2 (optional): sqlite table, shared by serve.py workers and restarts.
+    Results are stored as JSON, so every get() returns a fresh copy.
+    From async code use aget() / aput(): with the disk tier enabled they run
+    the sqlite query / commit in a worker thread, off the event loop.
+    """
+    def __init__(self, namespace, fingerprint_fn, db_path=None, memory_items=256):
+        self.namespace = namespace
+        self.fingerprint_fn = fingerprint_fn
+        self.db_path = db_path
+        self.memory_items = memory_items
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._fingerprint = None
+        self._counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "invalidations": 0}
+
+        # Opened on first use in each process (connections must not cross serve.py's fork)
+        self._db = None
+        self._db_pid = None
+
+    def _connection(self):
+        # Caller holds self._lock
+        if not self.db_path:
+            return None
+        if self._db_pid != os.getpid():
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL") # A cache can lose its last writes on power loss
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "namespace TEXT, key TEXT, fingerprint TEXT, result_json TEXT, created_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def key(self, *parts):
+        """
+        Cache key for the request parts (digests, modes, tile coordinates...).
+        """
+        return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+    def _check_fingerprint(self):
+        # Caller holds self._lock
+        fingerprint = self.fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                self._counts["invalidations"] += 1
+                print(f"Result cache '{self.namespace}': model changed, dropping in-memory results")
+            self._memory.clear()
+            self._fingerprint = fingerprint
+        return fingerprint
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or None.
+        """
+        with self._lock:
+            fingerprint = self._check_fingerprint()
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counts["memory_hits"] += 1
+                return json.loads(data)
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT result_json FROM results WHERE namespace=? AND key=? AND fingerprint=?",
+                    (self.namespace, key, fingerprint)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self._counts["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self._counts["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        data = json.dumps(result)
+        with self._lock:
+            fingerprint = self._check_fingerprint()
+            self._remember(key, data)
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, fingerprint, data, time.time())
+                )
+                db.commit()
+
+    async def aget(self, key):
+        if self.db_path:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aput(self, key, result):
+        if self.db_path:
+            await asyncio.to_thread(self.put, key, result)
+        else:
+            self.put(key, result)
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            return stats
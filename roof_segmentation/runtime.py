@@ -0,0 +1,95 @@
+
+import os
+import numpy as np
+import torch
+
+try:
+    import config
+    from model import DeepLabV3Plus
+except ImportError:
+    from . import config
+    from .model import DeepLabV3Plus
+
+RUNTIMES = ("eager", "torchscript", "int8", "onnx")
+
+class OnnxModel:
+    """
+    Wraps an onnxruntime session so it can be called like the torch model:
+    [B, C, H, W] float tensor in, [B, 1, H, W] logits tensor out.
+    """
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort # Optional dependency, only needed for this runtime
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        logits = self.session.run(None, {self.input_name: x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+def runtime_device(runtime):
+    """
+    Device a runtime executes on. Quantized kernels (fbgemm/qnnpack) and the
+    onnxruntime CPU provider only run on CPU.
+    """
+    if runtime in ("int8", "onnx") or not torch.cuda.is_available():
+        return torch.device('cpu')
+    return torch.device('cuda')
+
+def runtime_path(runtime):
+    return {
+        "torchscript": config.TORCHSCRIPT_MODEL_PATH,
+        "int8": config.INT8_MODEL_PATH,
+        "onnx": config.ONNX_MODEL_PATH,
+    }[runtime]
+
+def load_eager_model(device):
+    """
+    DeepLabV3Plus in eval mode with the weights from config.BEST_MODEL_PATH.
+    With a checkpoint, the architecture is built on the meta device (no ImageNet
+    download, no random init) and the parameters are assigned straight from the
+    memory-mapped checkpoint, so weights are paged in from the file as used.
+    """
+    if os.path.exists(config.BEST_MODEL_PATH):
+        with torch.device('meta'):
+            model = DeepLabV3Plus(n_classes=config.NUM_CLASSES, backbone=config.BACKBONE, output_stride=config.OUTPUT_STRIDE, pretrained=False)
+        state_dict = torch.load(config.BEST_MODEL_PATH, map_location='cpu', mmap=True, weights_only=True)
+        model.load_state_dict(state_dict, assign=True)
+        model = model.to(device)
+        print("Model loaded from checkpoint.")
+    else:
+        model = DeepLabV3Plus(n_classes=config.NUM_CLASSES, backbone=config.BACKBONE, output_stride=config.OUTPUT_STRIDE).to(device)
+        print("Warning: No checkpoint found. Inference will use random weights.")
+    return model.eval() # Ensure eval mode for inference (fixes BatchNorm error with batch_size=1)
+
+def load_model(runtime, device):
+    """
+    Returns a callable model for the requested runtime:
+    - eager:       DeepLabV3Plus float32 from config.BEST_MODEL_PATH
+    - torchscript: traced float32 module (export.py --formats torchscript)
+    - int8:        statically quantized TorchScript module (CPU only)
+    - onnx:        onnxruntime session (CPU)
+    Raises FileNotFoundError if the runtime's exported artifact is missing
+    (serving the eager model instead would be reported as the wrong runtime).
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{runtime}'. Options: {', '.join(RUNTIMES)}")
+    if runtime == "eager":
+        return load_eager_model(device)
+
+    path = runtime_path(runtime)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{runtime} artifact not found at {path}. "
+                                f"Run export.py --formats {runtime}, or use INFERENCE_RUNTIME = \"eager\".")
+
+    print(f"Loading {runtime} runtime from {path}")
+    if runtime == "onnx":
+        return OnnxModel(path)
+    return torch.jit.load(path, map_location=device).eval()
@@ -0,0 +1,68 @@
+
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+
+# Load generator for GET /segment:
+#     python segment_load.py --url http://localhost:8000 --users 50 --requests 500
+# Each simulated user clicks random points around --lat/--lng back to back.
+
+async def user_loop(client, url, queue, lat, lng, spread, results):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        params = {"lat": lat + random.uniform(-spread, spread), "lng": lng + random.uniform(-spread, spread)}
+        start = time.perf_counter()
+        try:
+            resp = await client.get(url, params=params)
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        results.append((status, time.perf_counter() - start))
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+async def run(args):
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+
+    results = []
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            user_loop(client, "/segment", queue, args.lat, args.lng, args.spread, results)
+            for _ in range(args.users)
+        ])
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000.0 for status, latency in results if status == 200]
+    print(f"{len(results)} requests, {args.users} concurrent users, {elapsed:.1f} s")
+    print(f"Throughput: {len(results) / elapsed:.1f} req/s ({len(latencies) / elapsed:.1f} successful req/s)")
+    print(f"Latency (200s): p50 {percentile(latencies, 0.5):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms, "
+          f"p99 {percentile(latencies, 0.99):.0f} ms")
+    print("Status codes: " + ", ".join(f"{status}: {count}" for status, count in Counter(s for s, _ in results).most_common()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the /segment endpoint.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="Total requests across all users")
+    parser.add_argument("--lat", type=float, default=18.4655) # San Juan, Puerto Rico
+    parser.add_argument("--lng", type=float, default=-66.1057)
+    parser.add_argument("--spread", type=float, default=0.01, help="Degrees of random jitter around --lat/--lng")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+
+import os
+import time
+import signal
+import socket
+import argparse
+import multiprocessing
+import torch
+import uvicorn
+
+from . import config
+from . import api
+from .model_registry import get_model
+
+# Multi-worker serving for api.py:
+#     python -m roof_segmentation.serve --workers 4
+# The parent loads the model once into shared memory, binds the listening socket
+# and forks the uvicorn workers, which inherit both, so the weights exist once
+# in RAM. Workers accept connections from the same socket.
+# CPU only: CUDA state does not survive fork, so a GPU model is served by a
+# single process (python -m roof_segmentation.api).
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def load_shared_model():
+    """
+    Loads the serving model through the registry (so api.get_batcher() in each
+    worker finds it already loaded) and moves its tensors to shared memory.
+    """
+    # Single-threaded in the parent so no OpenMP thread pool exists at fork time
+    torch.set_num_threads(1)
+    model, device = get_model()
+    if isinstance(model, torch.nn.Module) and device.type == 'cpu':
+        model.share_memory()
+    return model, device
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(index, sock, readiness, threads):
+    """
+    Worker process body: pins intra-op threads, then serves api.app on the
+    inherited socket. api's startup hook creates the batcher (threads do not
+    survive fork) and flags this worker as ready.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    torch.set_num_threads(threads)
+
+    api.worker_readiness = readiness
+    api.worker_index = index
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level="info"))
+    server.run(sockets=[sock])
+
+def spawn_worker(index, sock, readiness, threads):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(index, sock, readiness, threads)
+        except Exception as e:
+            print(f"Worker {index} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    print(f"Started worker {index} (pid {pid}, {threads} threads)")
+    return pid
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the roof segmentation API with N forked workers sharing one model.")
+    parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS)
+    parser.add_argument("--threads", type=int, default=config.SERVE_THREADS_PER_WORKER, help="Intra-op threads per worker (0 = cores // workers)")
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    args = parser.parse_args()
+
+    cores = available_cores()
+    threads = args.threads or max(1, cores // args.workers)
+
+    # 1. Weights loaded once, before forking
+    _, device = load_shared_model()
+    if device.type == 'cuda':
+        raise SystemExit("serve.py forks its workers, and CUDA state does not survive fork. "
+                         "Serve a GPU model with a single process: python -m roof_segmentation.api")
+    # 2. One listening socket shared by all workers
+    sock = bind_socket(args.host, args.port)
+    # 3. Per-worker readiness flags in shared memory (see GET /ready)
+    readiness = multiprocessing.Array('b', args.workers, lock=False)
+
+    print(f"Serving on {args.host}:{args.port}: {args.workers} workers x {threads} threads ({cores} cores)")
+    workers = {spawn_worker(i, sock, readiness, threads): i for i in range(args.workers)}
+
+    stopping = []
+    def shutdown(signum, frame):
+        stopping.append(signum)
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # 4. Supervise: restart workers that die unless shutting down. Workers that die
+    # before becoming ready are restarted with a growing delay; after
+    # SERVE_MAX_STARTUP_FAILURES in a row the server gives up instead of fork-looping.
+    startup_failures = [0] * args.workers
+    exit_code = 0
+    while workers:
+        pid, status = os.wait()
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        was_ready = readiness[index]
+        readiness[index] = 0
+        if stopping:
+            continue
+
+        startup_failures[index] = 0 if was_ready else startup_failures[index] + 1
+        if startup_failures[index] >= config.SERVE_MAX_STARTUP_FAILURES:
+            print(f"Worker {index} died {startup_failures[index]} times before becoming ready. Shutting down.")
+            exit_code = 1
+            shutdown(None, None)
+            continue
+
+        delay = min(config.SERVE_RESTART_DELAY * 2 ** startup_failures[index], config.SERVE_MAX_RESTART_DELAY)
+        print(f"Worker {index} (pid {pid}) exited with status {status}. Restarting in {delay:.1f}s.")
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not stopping:
+            workers[spawn_worker(index, sock, readiness, threads)] = index
+    sock.close()
+    if exit_code:
+        raise SystemExit(exit_code)
+
+if __name__ == "__main__":
+    main()
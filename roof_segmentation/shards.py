@@ -0,0 +1,134 @@
+
+import os
+import json
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+try:
+    import config
+    from dataset import RoofDataset
+except ImportError:
+    from . import config
+    from .dataset import RoofDataset
+
+def shard_paths(prefix):
+    return {
+        "index": prefix + ".index.json",
+        "images": prefix + ".images.npy",
+        "masks": prefix + ".masks.npy",
+    }
+
+def write_sample(dataset, images, masks, idx):
+    """
+    Decodes sample idx of dataset into row idx of the images / masks memmaps.
+    """
+    image, mask = dataset.load_uint8(idx)
+    images[idx] = image
+    masks[idx] = mask if mask is not None else 0
+
+def pack_shard(image_dir, mask_dir, prefix, input_size=config.INPUT_SIZE, workers=8):
+    """
+    Offline packing step: decodes every RoofDataset sample once and writes
+    uint8 tiles into contiguous memory-mappable .npy arrays plus an index file.
+      <prefix>.images.npy  [N, input_size, input_size, 3] uint8 RGB
+      <prefix>.masks.npy   [N, input_size, input_size]    uint8 0/1 labels
+      <prefix>.index.json  sample names and shapes
+    """
+    dataset = RoofDataset(image_dir=image_dir, mask_dir=mask_dir, input_size=input_size)
+    n = len(dataset)
+    if n == 0:
+        raise FileNotFoundError(f"No images found in {image_dir}")
+
+    out_dir = os.path.dirname(prefix)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    paths = shard_paths(prefix)
+    images = np.lib.format.open_memmap(paths["images"], mode="w+", dtype=np.uint8, shape=(n, input_size, input_size, 3))
+    masks = np.lib.format.open_memmap(paths["masks"], mode="w+", dtype=np.uint8, shape=(n, input_size, input_size))
+
+    # cv2 releases the GIL while decoding, so threads scale here
+    write = partial(write_sample, dataset, images, masks)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, _ in enumerate(pool.map(write, range(n)), 1):
+            if done % 1000 == 0 or done == n:
+                print(f"Packed {done}/{n} tiles")
+
+    images.flush()
+    masks.flush()
+    del images, masks
+
+    with open(paths["index"], "w") as f:
+        json.dump({"count": n, "input_size": input_size, "has_masks": bool(mask_dir), "names": dataset.images}, f)
+    print(f"Shard written to {prefix}.*")
+
+class ShardDataset(Dataset):
+    """
+    Reads samples from a packed shard without decoding or copying.
+    Returns uint8 tensors (image [3, H, W], mask [H, W]) that are views of the
+    memory map; normalize on the device with normalize_images() after transfer.
+    """
+    def __init__(self, prefix, transform=None):
+        self.paths = shard_paths(prefix)
+        with open(self.paths["index"]) as f:
+            self.index = json.load(f)
+        self.transform = transform
+        self.has_masks = self.index["has_masks"]
+        self.images_array = None
+        self.masks_array = None
+
+    def _open(self):
+        # Opened lazily so each DataLoader worker maps the files itself instead
+        # of receiving a pickled copy of the arrays.
+        # mmap_mode='c': copy-on-write views, so torch gets writable arrays without a copy
+        self.images_array = np.load(self.paths["images"], mmap_mode="c")
+        if self.has_masks:
+            self.masks_array = np.load(self.paths["masks"], mmap_mode="c")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["images_array"] = None
+        state["masks_array"] = None
+        return state
+
+    def __len__(self):
+        return self.index["count"]
+
+    def __getitem__(self, idx):
+        if self.images_array is None:
+            self._open()
+        image = self.images_array[idx]
+        mask = self.masks_array[idx] if self.has_masks else None
+
+        if self.transform is not None:
+            image, mask = self.transform(image, mask)
+
+        image = torch.from_numpy(image).permute(2, 0, 1) # C, H, W (view)
+        if self.has_masks:
+            return image, torch.from_numpy(mask)
+        return image
+
+def normalize_images(images, device):
+    """
+    Moves a batch to the device and normalizes it there. uint8 batches (from
+    ShardDataset) are converted to float32 [0, 1] on the device; float batches
+    (from RoofDataset) are already normalized.
+    """
+    images = images.to(device, non_blocking=True)
+    if images.dtype == torch.uint8:
+        images = images.float().div_(255.0)
+    return images
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack RoofDataset tiles into a memory-mapped shard.")
+    parser.add_argument("--image-dir", default=config.DATA_DIR)
+    parser.add_argument("--mask-dir", default=config.PROCESSED_DIR)
+    parser.add_argument("--out", default=config.TRAIN_SHARD or "data/shards/train")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+    pack_shard(args.image_dir, args.mask_dir, args.out, workers=args.workers)
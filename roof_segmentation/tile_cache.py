@@ -0,0 +1,186 @@
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+
+class TileCache:
+    """
+    Two-level cache for satellite tiles keyed by (z, x, y).
+    Level 1: in-memory LRU of decoded arrays (skips network and cv2.imdecode).
+    Level 2: on-disk sqlite store of encoded bytes (MBTiles-style table) with
+    TTL and size-based eviction.
+    Concurrent misses for the same tile are coalesced into a single download.
+
+    loader: callable (z, x, y) -> encoded image bytes, or None on failure.
+    """
+    def __init__(self, loader, db_path=None, memory_items=512, ttl_seconds=30 * 24 * 3600, max_disk_bytes=512 * 1024 * 1024):
+        self.loader = loader
+        self.memory_items = memory_items
+        self.ttl = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "fetch_errors": 0}
+
+        # Opened on first use in each process: a sqlite connection must not be
+        # carried across a fork (serve.py forks its workers after importing utils)
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+    def get(self, z, x, y):
+        """
+        Returns the decoded BGR tile for (z, x, y), or None if it cannot be fetched.
+        """
+        key = (z, x, y)
+
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return img
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                owner = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            img = self._load(key)
+            future.set_result(img)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return img
+
+    def _load(self, key):
+        data = self._disk_get(key)
+        from_disk = data is not None
+        with self._lock:
+            self.stats["disk_hits" if from_disk else "misses"] += 1
+        if not from_disk:
+            data = self.loader(*key)
+            if data is None:
+                with self._lock:
+                    self.stats["fetch_errors"] += 1
+                return None
+
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            with self._lock:
+                self.stats["fetch_errors"] += 1
+            return None
+
+        if not from_disk:
+            self._disk_put(key, data)
+        img.flags.writeable = False # Shared between callers; copy before drawing on it
+
+        with self._lock:
+            self._memory[key] = img
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return img
+
+    # --- Disk tier ---
+
+    def _connection(self):
+        """
+        This process's sqlite connection. Caller holds _db_lock.
+        """
+        if self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tiles ("
+                "zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                "tile_data BLOB, fetched_at REAL, accessed_at REAL, "
+                "PRIMARY KEY (zoom_level, tile_column, tile_row))"
+            )
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles").fetchone()[0]
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _disk_get(self, key):
+        if not self.db_path:
+            return None
+        now = time.time()
+        with self._db_lock:
+            self._connection()
+            row = self._db.execute(
+                "SELECT tile_data, fetched_at FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", key
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", key)
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE tiles SET accessed_at=? WHERE zoom_level=? AND tile_column=? AND tile_row=?", (now,) + key
+            )
+            self._db.commit()
+        return row[0]
+
+    def _disk_put(self, key, data):
+        if not self.db_path:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._connection()
+            row = self._db.execute(
+                "SELECT LENGTH(tile_data) FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", key
+            ).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)", key + (sqlite3.Binary(data), now, now))
+            self._disk_bytes += len(data) - (row[0] if row else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """
+        Drops expired tiles, then least recently accessed tiles until the
+        store fits in max_disk_bytes. Caller holds _db_lock.
+        """
+        self._db.execute("DELETE FROM tiles WHERE fetched_at < ?", (time.time() - self.ttl,))
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles").fetchone()[0]
+        rows = self._db.execute(
+            "SELECT zoom_level, tile_column, tile_row, LENGTH(tile_data) FROM tiles ORDER BY accessed_at"
+        )
+        evicted = []
+        for z, x, y, size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            evicted.append((z, x, y))
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", evicted)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
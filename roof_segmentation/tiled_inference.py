@@ -0,0 +1,74 @@
+
+import itertools
+import numpy as np
+import torch
+
+try:
+    from dataset import iter_tile_windows, pad_tile
+except ImportError:
+    from .dataset import iter_tile_windows, pad_tile
+
+# tiled: overlapping INPUT_SIZE tiles at native resolution (one forward pass per tile)
+# resize: whole image resized to INPUT_SIZE (one forward pass)
+INFERENCE_MODES = ("tiled", "resize")
+
+def cosine_window(tile_size):
+    """
+    2D raised-cosine (Hann) blending weights for a tile_size x tile_size tile.
+    Centre pixels weigh ~1, borders taper towards a small floor (never 0, so image
+    edges covered by a single tile still get a valid prediction).
+    """
+    ramp = 0.5 - 0.5 * np.cos(2.0 * np.pi * (np.arange(tile_size, dtype=np.float32) + 0.5) / tile_size)
+    ramp = np.maximum(ramp, 1e-2)
+    return np.outer(ramp, ramp).astype(np.float32)
+
+def iter_tile_batches(image, tile_size=512, overlap=128, batch_size=4):
+    """
+    Streams an RGB uint8 image as batches of overlapping, normalized tiles.
+    Yields (windows, tensor) with windows = [(y, x, y_end, x_end), ...] and
+    tensor = [B, C, tile_size, tile_size] float32. Only one batch lives in memory.
+    """
+    h, w = image.shape[:2]
+    stride = max(1, tile_size - overlap)
+    windows = iter_tile_windows(h, w, tile_size, stride)
+
+    while True:
+        chunk = list(itertools.islice(windows, batch_size))
+        if not chunk:
+            return
+        tiles = np.stack([pad_tile(image[y:y_end, x:x_end], tile_size) for y, x, y_end, x_end in chunk])
+        tensor = torch.from_numpy(tiles.astype(np.float32) / 255.0).permute(0, 3, 1, 2)
+        yield chunk, tensor
+
+class TileBlender:
+    """
+    Accumulates per-tile probability maps into a full-resolution map using
+    cosine-weighted averaging over the overlapping regions.
+    """
+    def __init__(self, h, w, tile_size=512):
+        self.weight = cosine_window(tile_size)
+        self.prob_sum = np.zeros((h, w), dtype=np.float32)
+        self.weight_sum = np.zeros((h, w), dtype=np.float32)
+
+    def add(self, windows, prob_maps):
+        for (y, x, y_end, x_end), prob in zip(windows, prob_maps):
+            th, tw = y_end - y, x_end - x
+            weight = self.weight[:th, :tw]
+            self.prob_sum[y:y_end, x:x_end] += prob[:th, :tw] * weight
+            self.weight_sum[y:y_end, x:x_end] += weight
+
+    def result(self):
+        return self.prob_sum / np.maximum(self.weight_sum, 1e-6)
+
+def predict_tiled(image, predict_batch, tile_size=512, overlap=128, batch_size=4):
+    """
+    Sliding-window inference over an arbitrarily large RGB uint8 image.
+    predict_batch: callable mapping a [B, C, T, T] tensor to a [B, T, T] numpy
+    probability array.
+    Returns the blended [H, W] probability map.
+    """
+    h, w = image.shape[:2]
+    blender = TileBlender(h, w, tile_size)
+    for windows, batch in iter_tile_batches(image, tile_size, overlap, batch_size):
+        blender.add(windows, predict_batch(batch))
+    return blender.result()
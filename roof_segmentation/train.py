@@ -1,119 +1,251 @@
 
 import os
+import resource
+import argparse
+import contextlib
 import torch
 import torch.optim as optim
-from torch.utils.data import DataLoader, random_split
+from torch.utils.data import random_split, Subset
+from torch.utils.data.distributed import DistributedSampler
 from tqdm import tqdm
 
-import config
-from model import DeepLabV3Plus
-from dataset import RoofDataset
-from loss import FocalLoss
+# Absolute imports when run as a script from this directory, relative when
+# imported as part of the package (e.g. by the tests)
+try:
+    import config
+    from model import DeepLabV3Plus
+    from dataset import RoofDataset
+    from shards import ShardDataset, normalize_images
+    from data_loading import build_loader, with_transform, RoofAugment, ThroughputMeter
+    from loss import FocalLoss, FusedFocalLoss
+    from metrics import SegmentationMetrics
+    from checkpointing import AsyncCheckpointer, training_state, latest_checkpoint, restore_rng_state, to_cpu
+    from distributed import setup_distributed, cleanup_distributed, is_main_process, wrap_model, unwrap_model
+except ImportError:
+    from . import config
+    from .model import DeepLabV3Plus
+    from .dataset import RoofDataset
+    from .shards import ShardDataset, normalize_images
+    from .data_loading import build_loader, with_transform, RoofAugment, ThroughputMeter
+    from .loss import FocalLoss, FusedFocalLoss
+    from .metrics import SegmentationMetrics
+    from .checkpointing import AsyncCheckpointer, training_state, latest_checkpoint, restore_rng_state, to_cpu
+    from .distributed import setup_distributed, cleanup_distributed, is_main_process, wrap_model, unwrap_model
 
-def calculate_iou(pred, target, n_classes=2):
+def split_dataset(full_dataset):
     """
-    Calculate IoU (Intersection over Union)
-    pred: [B, H, W] (0 or 1)
-    target: [B, H, W] (0 or 1)
+    80/20 train/val split. Seeded so every run (and benchmark_backbones.py)
+    validates on the same tiles.
     """
-    iou_list = []
-    pred = pred.view(-1)
-    target = target.view(-1)
-    
-    # Ignore background for mIoU focus on Roof? 
-    # Usually mIoU is average of all classes (0 and 1).
-    
-    for cls in range(n_classes):
-        pred_inds = (pred == cls)
-        target_inds = (target == cls)
-        
-        intersection = (pred_inds & target_inds).sum().float()
-        union = (pred_inds | target_inds).sum().float()
-        
-        if union == 0:
-            iou_list.append(float('nan'))
-        else:
-            iou_list.append(intersection / union)
-            
-    return torch.tensor(iou_list).nanmean()
+    train_size = int(0.8 * len(full_dataset))
+    val_size = len(full_dataset) - train_size
+    generator = torch.Generator().manual_seed(config.SPLIT_SEED)
+    return random_split(full_dataset, [train_size, val_size], generator=generator)
+
+def resolve_amp_dtype(device):
+    """
+    Autocast dtype from config.AMP_DTYPE. 'auto' picks bfloat16 on CPU (the only
+    reduced precision CPU autocast supports) and float16 on CUDA.
+    """
+    if config.AMP_DTYPE == "auto":
+        return torch.float16 if device.type == 'cuda' else torch.bfloat16
+    return {"bfloat16": torch.bfloat16, "float16": torch.float16}[config.AMP_DTYPE]
+
+def peak_memory_mb(device):
+    """
+    Peak allocated memory: CUDA allocator peak on GPU, process max RSS on CPU.
+    """
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 1024 ** 2
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss is KB on Linux
+
+def train_step(model, images, masks, criterion, optimizer, scaler, amp_dtype, sync_step, accum_steps=1, distributed=False):
+    """
+    One batch of the training loop: autocast forward, float32 loss, scaled
+    backward. The optimizer steps only on sync_step (the last batch of a
+    gradient-accumulation window). Returns the (unscaled) loss.
+    """
+    # Under DDP, skip the gradient all-reduce on the intermediate batches
+    no_sync = model.no_sync() if distributed and not sync_step else contextlib.nullcontext()
+    with no_sync:
+        with torch.autocast(device_type=images.device.type, dtype=amp_dtype, enabled=config.AMP_ENABLED):
+            outputs = model(images)
 
-def train():
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    print(f"Using device: {device}")
+        # Masks are [B, H, W], Outputs [B, 1, H, W]. Loss in float32.
+        loss = criterion(outputs.float(), masks.float())
+        scaler.scale(loss / accum_steps).backward()
+
+    if sync_step:
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.zero_grad(set_to_none=True)
+    return loss
+
+def train(backbone=config.BACKBONE, output_stride=config.OUTPUT_STRIDE, checkpoint_path=config.BEST_MODEL_PATH, resume=None):
+    """
+    resume: path of a checkpoint_epochXXX.pth file, or 'latest' for the newest
+    one in config.CHECKPOINT_DIR. Continues from the epoch after it.
+    """
+    # torchrun sets WORLD_SIZE/RANK; otherwise this is a single process
+    rank, world_size, device = setup_distributed()
+    if is_main_process():
+        print(f"Using device: {device} ({world_size} process{'es' if world_size > 1 else ''})")
     
-    # 1. Dataset
-    full_dataset = RoofDataset(image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, input_size=config.INPUT_SIZE)
+    # Shuffle order and loader worker seeds come from this stream (saved in each
+    # checkpoint), so a resumed run draws the same batches and augmentations
+    loader_generator = torch.Generator().manual_seed(config.SPLIT_SEED)
+    
+    # 1. Dataset (packed memory-mapped shard if available, else decode images every epoch)
+    if config.TRAIN_SHARD and os.path.exists(config.TRAIN_SHARD + ".index.json"):
+        print(f"Reading training tiles from shard {config.TRAIN_SHARD}")
+        full_dataset = ShardDataset(config.TRAIN_SHARD)
+    else:
+        full_dataset = RoofDataset(image_dir=config.DATA_DIR, mask_dir=config.PROCESSED_DIR, input_size=config.INPUT_SIZE)
     if len(full_dataset) > 0:
-        train_size = int(0.8 * len(full_dataset))
-        val_size = len(full_dataset) - train_size
-        train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
+        train_dataset, val_dataset = split_dataset(full_dataset)
+        if config.AUGMENT:
+            # Augmented copy for the training indices only (runs in the loader workers)
+            train_dataset.dataset = with_transform(full_dataset, RoofAugment())
         
-        train_loader = DataLoader(train_dataset, batch_size=config.BATCH_SIZE, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=config.BATCH_SIZE, shuffle=False)
+        # Each process trains / validates on its own 1/world_size of the split
+        train_sampler = DistributedSampler(train_dataset, shuffle=True, seed=config.SPLIT_SEED) if world_size > 1 else None
+        if world_size > 1:
+            # Strided shards without padding: DistributedSampler would repeat tiles to
+            # even out the ranks, and repeats would be counted twice in the all-reduced IoU
+            val_dataset = Subset(val_dataset, range(rank, len(val_dataset), world_size))
+        # Persistent workers would carry their augmentation RNG from epoch to epoch,
+        # which no checkpoint can capture; fresh workers are reseeded every epoch
+        train_loader = build_loader(train_dataset, shuffle=True, sampler=train_sampler, generator=loader_generator,
+                                    persistent_workers=config.PERSISTENT_WORKERS and not config.AUGMENT)
+        # Own generator too: a persistent val loader draws its worker seed once, and from
+        # the global RNG (dropout) that would happen at a different point after a resume
+        val_loader = build_loader(val_dataset, shuffle=False, generator=torch.Generator().manual_seed(config.SPLIT_SEED))
     else:
         print("Warning: No data found in data/raw. Creating dummy data structure for validation of script.")
         train_loader = None
         val_loader = None
         
     # 2. Model
-    model = DeepLabV3Plus(n_classes=1, backbone=config.BACKBONE).to(device)
+    model = DeepLabV3Plus(n_classes=1, backbone=backbone, output_stride=output_stride).to(device)
+    if config.CHANNELS_LAST:
+        model = model.to(memory_format=torch.channels_last)
+    model = wrap_model(model, device)
     
     # 3. Loss & Optimizer
-    criterion = FocalLoss(alpha=config.LOSS_ALPHA, gamma=config.LOSS_GAMMA)
+    loss_class = FusedFocalLoss if config.FUSED_FOCAL_LOSS else FocalLoss
+    criterion = loss_class(alpha=config.LOSS_ALPHA, gamma=config.LOSS_GAMMA)
     optimizer = optim.Adam(model.parameters(), lr=config.LEARNING_RATE)
     
-    # 4. Training Loop
+    # Mixed precision: loss scaling is only needed for float16 (bfloat16 has float32's range)
+    amp_dtype = resolve_amp_dtype(device)
+    scaler = torch.amp.GradScaler(device.type, enabled=config.AMP_ENABLED and amp_dtype == torch.float16)
+    accum_steps = max(1, config.GRAD_ACCUM_STEPS)
+    if config.AMP_ENABLED and is_main_process():
+        print(f"AMP enabled ({amp_dtype}), effective batch size {config.BATCH_SIZE * accum_steps * world_size}")
+    
+    # 4. Resume (model, optimizer, scaler, epoch, best metric, RNG streams)
+    start_epoch = 0
     best_iou = 0.0
+    if resume:
+        resume_path = latest_checkpoint(config.CHECKPOINT_DIR) if resume == "latest" else resume
+        if resume_path is None or not os.path.exists(resume_path):
+            print(f"Warning: No checkpoint found to resume from ({resume}). Starting from scratch.")
+        else:
+            state = torch.load(resume_path, map_location='cpu', weights_only=False)
+            unwrap_model(model).load_state_dict(state["model"])
+            optimizer.load_state_dict(state["optimizer"])
+            if state["scaler"] and scaler.is_enabled():
+                scaler.load_state_dict(state["scaler"])
+            start_epoch = state["epoch"]
+            best_iou = state["best_metric"]
+            # Restored last so the next epoch draws the same shuffles / augmentations
+            restore_rng_state(state["rng"], loader_generator)
+            if is_main_process():
+                print(f"Resumed from {resume_path} (epoch {start_epoch}, best mIoU {best_iou:.4f})")
     
-    if not os.path.exists(config.CHECKPOINT_DIR):
-        os.makedirs(config.CHECKPOINT_DIR)
+    # 5. Training Loop
+    checkpointer = None
+    if is_main_process():
+        # Background writer: the loop only pays for the device -> CPU copy
+        checkpointer = AsyncCheckpointer(config.CHECKPOINT_DIR, keep_last=config.CHECKPOINT_KEEP_LAST)
         
-    for epoch in range(config.EPOCHS):
+    for epoch in range(start_epoch, config.EPOCHS):
         if train_loader is None:
             break
             
         model.train()
         train_loss = 0.0
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
         
-        progress_bar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{config.EPOCHS}")
-        for images, masks in progress_bar:
-            images = images.to(device)
-            masks = masks.to(device)
-            
-            optimizer.zero_grad()
-            outputs = model(images)
-            
-            # Masks are [B, H, W], Outputs [B, 1, H, W]
-            loss = criterion(outputs, masks.float())
-            loss.backward()
-            optimizer.step()
+        meter = ThroughputMeter()
+        optimizer.zero_grad(set_to_none=True)
+        progress_bar = tqdm(train_loader, desc=f"Epoch {epoch+1}/{config.EPOCHS}", disable=not is_main_process())
+        for step, (images, masks) in enumerate(progress_bar):
+            images = normalize_images(images, device)
+            masks = masks.to(device, non_blocking=True).long()
+            if config.CHANNELS_LAST:
+                images = images.contiguous(memory_format=torch.channels_last)
+            meter.data_ready()
             
+            # Gradient accumulation: one optimizer step every accum_steps batches
+            sync_step = (step + 1) % accum_steps == 0 or step + 1 == len(train_loader)
+            loss = train_step(model, images, masks, criterion, optimizer, scaler, amp_dtype, sync_step,
+                              accum_steps=accum_steps, distributed=world_size > 1)
+
             train_loss += loss.item()
+            meter.step_done(images.shape[0])
             progress_bar.set_postfix({'loss': loss.item()})
             
         # Validation
         model.eval()
-        val_iou = 0.0
+        metrics = SegmentationMetrics(n_classes=2, device=device)
         with torch.no_grad():
             for images, masks in val_loader:
-                images = images.to(device)
-                masks = masks.to(device)
+                images = normalize_images(images, device)
+                masks = masks.to(device, non_blocking=True).long()
+                if config.CHANNELS_LAST:
+                    images = images.contiguous(memory_format=torch.channels_last)
                 
-                outputs = model(images)
-                preds = torch.sigmoid(outputs) > 0.5
-                preds = preds.squeeze(1).long()
+                with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=config.AMP_ENABLED):
+                    # Unwrapped: ranks may have different numbers of validation batches,
+                    # so no DDP collectives here
+                    outputs = unwrap_model(model)(images)
+                # Accumulated on the device; no host sync per batch
+                metrics.update_logits(outputs, masks)
                 
-                iou = calculate_iou(preds, masks, n_classes=2)
-                val_iou += iou.item()
-                
-        avg_val_iou = val_iou / len(val_loader)
-        print(f"Epoch {epoch+1} - Train Loss: {train_loss/len(train_loader):.4f} - Val mIoU: {avg_val_iou:.4f}")
+        # Global (pixel-weighted) scores over every process's validation tiles
+        metrics.all_reduce()
+        scores = metrics.compute()
+        avg_val_iou = scores["miou"]
+        if not is_main_process():
+            continue
+        throughput = meter.summary()
+        print(f"Epoch {epoch+1} - Train Loss: {train_loss/len(train_loader):.4f} - Val mIoU: {avg_val_iou:.4f} (roof {scores['roof_iou']:.4f}, "
+              f"P {scores['precision']:.3f} R {scores['recall']:.3f}, boundary F {scores['boundary_f']:.3f}) - "
+              f"{throughput['samples_per_sec']:.1f} samples/s (data wait {throughput['data_wait_fraction'] * 100:.1f}%) - "
+              f"Step {throughput['mean_step_ms']:.0f} ms - Peak mem {peak_memory_mb(device):.0f} MB")
         
         # Save Best Model
         if avg_val_iou > best_iou and avg_val_iou > 0.79: # Benchmark threshold
             print(f"New Best IoU: {avg_val_iou:.4f} (Saved)")
             best_iou = avg_val_iou
-            torch.save(model.state_dict(), config.BEST_MODEL_PATH)
+            checkpointer.save(to_cpu(unwrap_model(model).state_dict()), checkpoint_path)
+        
+        # Periodic full checkpoint for --resume
+        if config.CHECKPOINT_EVERY and (epoch + 1) % config.CHECKPOINT_EVERY == 0:
+            checkpointer.save_epoch(training_state(unwrap_model(model), optimizer, scaler, epoch + 1, best_iou, loader_generator))
+    
+    if checkpointer is not None:
+        checkpointer.close()
+    cleanup_distributed()
 
 if __name__ == '__main__':
-    train()
+    parser = argparse.ArgumentParser(description="Train DeepLabV3Plus roof segmentation.")
+    parser.add_argument("--backbone", default=config.BACKBONE)
+    parser.add_argument("--output-stride", type=int, default=config.OUTPUT_STRIDE)
+    parser.add_argument("--checkpoint", default=config.BEST_MODEL_PATH, help="Where to save the best model")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="Resume from a checkpoint file (default: latest in config.CHECKPOINT_DIR)")
+    args = parser.parse_args()
+    train(backbone=args.backbone, output_stride=args.output_stride, checkpoint_path=args.checkpoint, resume=args.resume)
@@ -1,10 +1,24 @@
 
+import os
 import cv2
+import threading
 import numpy as np
 import json
 import math
 import requests
 import io
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import config
+    from tile_cache import TileCache
+    from projection import pixels_to_latlng_array
+    from polygon_metrics import pack_polygons, polygon_metrics
+except ImportError:
+    from . import config
+    from .tile_cache import TileCache
+    from .projection import pixels_to_latlng_array
+    from .polygon_metrics import pack_polygons, polygon_metrics
 # shapely is standard for geo-calc, but we can implement basic area if package not guaranteed.
 # Assuming standard python env for ML often has simplified dependencies.
 # We will implement a shoelace formula for area to avoid extra deps if possible, 
@@ -32,48 +46,140 @@ def num2deg(xtile, ytile, zoom):
   lat_deg = math.degrees(lat_rad)
   return (lat_deg, lon_deg)
 
+# Keep-alive connection pool shared by all tile downloads
+_http = requests.Session()
+_http.headers.update({'User-Agent': 'Mozilla/5.0'})
+
+def download_tile(z, x, y):
+    """
+    Downloads one encoded tile (JPEG/PNG bytes) from config.TILE_URL_TEMPLATE.
+    Returns None on failure.
+    """
+    url = config.TILE_URL_TEMPLATE.format(z=z, x=x, y=y)
+    try:
+        resp = _http.get(url, timeout=config.TILE_FETCH_TIMEOUT)
+        if resp.status_code == 200:
+            return resp.content
+        print(f"Error fetching tile: {resp.status_code}")
+        return None
+    except Exception as e:
+        print(f"Exception fetching tile: {e}")
+        return None
+
+# Tile cache, created on the first tile fetch (importing utils touches no files)
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+
+def get_tile_cache():
+    global _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None:
+            db_path = os.path.join(config.CACHE_DIR, config.TILE_CACHE_PATH) if config.TILE_CACHE_PATH else None
+            _tile_cache = TileCache(
+                download_tile,
+                db_path=db_path,
+                memory_items=config.TILE_CACHE_MEMORY_ITEMS,
+                ttl_seconds=config.TILE_CACHE_TTL_SECONDS,
+                max_disk_bytes=config.TILE_CACHE_MAX_BYTES
+            )
+    return _tile_cache
+
+def tile_bbox(x, y, zoom):
+    """
+    Lat/Lng bounds of tile (x, y) at zoom.
+    """
+    nw = num2deg(x, y, zoom)
+    se = num2deg(x+1, y+1, zoom)
+    
+    return {
+        "north": nw[0], 
+        "west": nw[1], 
+        "south": se[0], 
+        "east": se[1]
+    }
+
 def fetch_satellite_tile(lat, lng, zoom=20):
     """
     Fetches a satellite tile for the location from Esri World Imagery (Public).
+    Served from the tile cache when the same (z, x, y) was requested before.
     Returns: (image_cv2, bounding_box_latLng)
     """
     x, y = deg2num(lat, lng, zoom)
     
-    # Esri World Imagery
-    url = f"https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{zoom}/{y}/{x}"
-    
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            arr = np.frombuffer(resp.content, np.uint8)
-            img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            
-            # Calculate bounds
-            nw = num2deg(x, y, zoom)
-            se = num2deg(x+1, y+1, zoom)
-            
-            bbox = {
-                "north": nw[0], 
-                "west": nw[1], 
-                "south": se[0], 
-                "east": se[1]
-            }
-            return img, bbox
-        else:
-            print(f"Error fetching tile: {resp.status_code}")
-            return None, None
-    except Exception as e:
-        print(f"Exception fetching tile: {e}")
+    img = get_tile_cache().get(zoom, x, y)
+    if img is None:
         return None, None
+    
+    return img, tile_bbox(x, y, zoom)
+
+def deg2pixel(lat_deg, lon_deg, zoom, tile_size=256):
+  """
+  Global (fractional) pixel coordinates of a location at zoom, i.e. deg2num
+  without truncation, scaled by tile_size.
+  """
+  lat_rad = math.radians(lat_deg)
+  n = 2.0 ** zoom
+  px = (lon_deg + 180.0) / 360.0 * n * tile_size
+  py = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n * tile_size
+  return (px, py)
 
-def segment_roof_from_center(image):
+def mosaic_window(lat, lng, zoom=20, size=None, tile_size=256):
     """
-    Uses FloodFill from the center of the image to find the roof.
-    Assumes user clicked (which is center of tile).
+    Tile block fetch_satellite_mosaic uses for a click, without fetching it.
+    Returns: (x0, y0, click_pixel) - top-left tile of the size x size block and
+    the (x, y) of (lat, lng) inside the mosaic.
+    """
+    size = size or config.MOSAIC_SIZE
+    px, py = deg2pixel(lat, lng, zoom, tile_size)
+    fx, fy = px / tile_size, py / tile_size
+    
+    x0 = int(math.floor(fx - size / 2.0 + 0.5))
+    y0 = int(math.floor(fy - size / 2.0 + 0.5))
+    click_pixel = (int(px - x0 * tile_size), int(py - y0 * tile_size))
+    return x0, y0, click_pixel
+
+_tile_pool = ThreadPoolExecutor(max_workers=config.TILE_FETCH_WORKERS, thread_name_prefix="tile-fetch")
+
+def fetch_satellite_mosaic(lat, lng, zoom=20, size=None, tile_size=256):
+    """
+    Fetches the size x size block of tiles around the clicked location in
+    parallel and stitches them into one image.
+    The block is chosen so the click lands as close to its centre as possible.
+    Returns: (image_cv2, bounding_box_latLng, click_pixel) where click_pixel is
+    the (x, y) of (lat, lng) inside the mosaic. (None, None, None) if the tile
+    under the click cannot be fetched; other missing tiles are left black.
+    """
+    size = size or config.MOSAIC_SIZE
+    x0, y0, click_pixel = mosaic_window(lat, lng, zoom, size, tile_size)
+    
+    keys = [(x0 + i, y0 + j) for j in range(size) for i in range(size)]
+    tile_cache = get_tile_cache()
+    tiles = list(_tile_pool.map(lambda k: tile_cache.get(zoom, k[0], k[1]), keys))
+    
+    click_key = (x0 + click_pixel[0] // tile_size, y0 + click_pixel[1] // tile_size)
+    if tiles[keys.index(click_key)] is None:
+        return None, None, None
+    
+    mosaic = np.zeros((size * tile_size, size * tile_size, 3), np.uint8)
+    for (x, y), tile in zip(keys, tiles):
+        if tile is None:
+            continue
+        oy, ox = (y - y0) * tile_size, (x - x0) * tile_size
+        mosaic[oy:oy + tile_size, ox:ox + tile_size] = tile
+    
+    nw = tile_bbox(x0, y0, zoom)
+    se = tile_bbox(x0 + size - 1, y0 + size - 1, zoom)
+    bbox = {"north": nw["north"], "west": nw["west"], "south": se["south"], "east": se["east"]}
+    
+    return mosaic, bbox, click_pixel
+
+def segment_roof_from_center(image, seed=None):
+    """
+    Uses FloodFill from the clicked pixel to find the roof.
+    seed: (x, y) of the click; defaults to the center of the image.
     """
     h, w = image.shape[:2]
-    center_point = (w // 2, h // 2)
+    center_point = tuple(int(v) for v in seed) if seed is not None else (w // 2, h // 2)
     
     # 1. Blur to remove noise
     blurred = cv2.GaussianBlur(image, (5, 5), 0)
@@ -96,6 +202,13 @@ def segment_roof_from_center(image):
     roof_mask = mask[1:-1, 1:-1]
     
     # 3. Find Contours on the mask
+    return largest_contour_polygon(roof_mask)
+
+def largest_contour_polygon(roof_mask):
+    """
+    Outline of the largest region of a binary mask, simplified with
+    approxPolyDP (2% of its perimeter). Returns [] for an empty mask.
+    """
     contours, _ = cv2.findContours(roof_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     if not contours:
@@ -110,33 +223,40 @@ def segment_roof_from_center(image):
     
     return approx.reshape(-1, 2) # List of [x, y]
 
-def pixels_to_latlng(pixel_polygon, bbox, img_shape):
+def segment_roof_from_mask(mask, seed, snap_radius=config.SEGMENT_SNAP_RADIUS):
     """
-    Maps pixel coordinates [x, y] to Lat/Lng based on tile bbox.
+    Picks the connected component of a model roof mask under the clicked pixel.
+    A click on background snaps to the nearest component within snap_radius px.
+    seed: (x, y) of the click. Returns the polygon, or [] if no roof is near the click.
     """
-    img_h, img_w = img_shape[:2]
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    _, labels = cv2.connectedComponents(mask, connectivity=8)
+    h, w = labels.shape
+    x = min(max(int(seed[0]), 0), w - 1)
+    y = min(max(int(seed[1]), 0), h - 1)
     
-    # Bbox: north(max_lat), south(min_lat), east(max_lon), west(min_lon)
-    lat_span = bbox["north"] - bbox["south"]
-    lon_span = bbox["east"] - bbox["west"]
+    label = labels[y, x]
+    if label == 0:
+        y0, x0 = max(0, y - snap_radius), max(0, x - snap_radius)
+        window = labels[y0:y + snap_radius + 1, x0:x + snap_radius + 1]
+        ys, xs = np.nonzero(window)
+        if len(ys) == 0:
+            return []
+        dist2 = (ys + y0 - y) ** 2 + (xs + x0 - x) ** 2
+        nearest = np.argmin(dist2)
+        if dist2[nearest] > snap_radius ** 2:
+            return []
+        label = window[ys[nearest], xs[nearest]]
     
-    encoded_coords = []
-    
-    for x, y in pixel_polygon:
-        # Pct
-        pct_x = x / img_w
-        pct_y = y / img_h
-        
-        # Mercator projection isn't perfectly linear but for a single tile (High Zoom), linear is very close.
-        # X maps to Longitude (West -> East)
-        lng = bbox["west"] + (pct_x * lon_span)
-        
-        # Y maps to Latitude (North -> South)
-        lat = bbox["north"] - (pct_y * lat_span)
-        
-        encoded_coords.append({"lat": lat, "lng": lng})
-        
-    return encoded_coords
+    return largest_contour_polygon((labels == label).astype(np.uint8))
+
+def pixels_to_latlng(pixel_polygon, bbox, img_shape):
+    """
+    Maps pixel coordinates [x, y] to Lat/Lng based on tile bbox.
+    Uses the Web Mercator projection (see projection.pixels_to_latlng_array).
+    """
+    latlng = pixels_to_latlng_array(pixel_polygon, bbox, img_shape)
+    return [{"lat": lat, "lng": lng} for lat, lng in latlng.tolist()]
 
 def polygonize_mask(mask, epsilon=1.0):
     """
@@ -166,35 +286,39 @@ def calculate_polygon_area(coords):
     """
     Calculates area of a polygon using Shoelace formula (Surveyor's formula).
     coords: List of [x, y] points.
+    For many polygons at once see polygon_metrics.polygon_metrics.
     """
     if len(coords) < 3:
         return 0.0
-        
-    area = 0.0
-    n = len(coords)
-    j = n - 1 # Last vertex
     
-    for i in range(n):
-        area += (coords[j][0] + coords[i][0]) * (coords[j][1] - coords[i][1])
-        j = i
-        
-    return abs(area / 2.0)
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    x, y = pts[:, 0], pts[:, 1]
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2.0)
 
-def mask_to_geojson(mask, epsilon=1.0, class_id=1):
+def mask_to_geojson(mask, epsilon=1.0, class_id=1, prob_map=None):
     """
     Full pipeline: Mask -> Polygons -> GeoJSON dict
+    prob_map: model probabilities at the mask's resolution. Each feature's
+    confidence is the mean probability inside it (1.0 without a prob_map).
     """
     polygons = polygonize_mask(mask, epsilon)
-    features = []
     
-    for poly in polygons:
-        area = calculate_polygon_area(poly)
+    # Metrics of all polygons in one vectorized pass
+    vertices, offsets = pack_polygons(polygons)
+    metrics = polygon_metrics(vertices, offsets, prob_map=prob_map)
+    
+    features = []
+    for i, poly in enumerate(polygons):
+        confidence = float(metrics["mean_probability"][i]) if prob_map is not None else 1.0
         feature = {
             "type": "Feature",
             "properties": {
                 "class_id": class_id,
-                "confidence": 1.0, # Placeholder, needing model probability map integration for real score
-                "area_pixels": area
+                "confidence": round(confidence, 4),
+                "area_pixels": float(metrics["area"][i]),
+                "perimeter_pixels": round(float(metrics["perimeter"][i]), 2),
+                "centroid": [round(float(v), 2) for v in metrics["centroid"][i]],
+                "bbox": [int(v) for v in metrics["bbox"][i]] # [min_x, min_y, max_x, max_y]
             },
             "geometry": {
                 "type": "Polygon",
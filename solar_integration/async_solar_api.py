@@ -0,0 +1,130 @@
+
+import asyncio
+import httpx
+
+try:
+    from solar_api import SolarAPIClient
+except ImportError:
+    from .solar_api import SolarAPIClient
+
+class AsyncSolarAPIClient(SolarAPIClient):
+    """
+    asyncio-native client for Google Solar API.
+    - One shared keep-alive connection pool (httpx.AsyncClient).
+    - Bounded concurrency (max_concurrency requests on the wire at once).
+    - Identical in-flight requests (same endpoint, lat, lng, quality) are merged
+      into one HTTP call; every caller receives the same result dict.
+    Use as `async with AsyncSolarAPIClient(key) as client: ...` or call aclose().
+    cache (InsightsCache) lookups and writes are sqlite calls, so they run in a
+    worker thread (asyncio.to_thread) instead of on the event loop.
+    transport: optional httpx transport (e.g. httpx.MockTransport in tests).
+    """
+    def __init__(self, api_key, base_url="https://solar.googleapis.com/v1", timeout=10, max_concurrency=16, max_keepalive=16, cache=None,
+                 transport=None):
+        super(AsyncSolarAPIClient, self).__init__(api_key, base_url=base_url, timeout=timeout, cache=cache)
+        self.session = None # The sync requests.Session is not used here
+        self.max_concurrency = max_concurrency
+        self.max_keepalive = max_keepalive
+        self.transport = transport
+        self._client = None
+        self._semaphore = None
+        self._inflight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _http(self):
+        # Created lazily so the pool and semaphore bind to the running loop
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_keepalive)
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits,
+                                             transport=self.transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _coalesce(self, key, factory):
+        """
+        Runs factory() once per key while a call for that key is in flight.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def _get_json(self, path, params):
+        client = self._http()
+        async with self._semaphore:
+            response = await client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_roof_geometry(self, lat, lng, quality="HIGH"):
+        """
+        Fetches building insights and extracts vector geometry.
+        """
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, lat, lng, quality)
+            if cached is not None:
+                return cached
+            # Nearby clicks in the same geohash cell also share one in-flight call
+            key = ("buildingInsights",) + self.cache.key(lat, lng, quality)
+        else:
+            key = ("buildingInsights", lat, lng, quality)
+        return await self._coalesce(key, lambda: self._fetch_roof_geometry(lat, lng, quality))
+
+    async def _fetch_roof_geometry(self, lat, lng, quality):
+        params = {
+            "location.latitude": lat,
+            "location.longitude": lng,
+            "requiredQuality": quality,
+            "key": self.api_key
+        }
+        try:
+            data = await self._get_json("/buildingInsights:findClosest", params)
+            result = self._build_geometry(data)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, lat, lng, quality, data, result)
+            return result
+        except httpx.HTTPStatusError as e:
+            return await asyncio.to_thread(self._cache_http_error, lat, lng, quality, e.response.status_code, str(e))
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    async def get_visual_mask(self, lat, lng, radius_meters=50):
+        """
+        Fetches Data Layers (GeoTIFFs) URLs for visual overlay.
+        """
+        return await self._coalesce(("dataLayers", lat, lng, radius_meters), lambda: self._fetch_visual_mask(lat, lng, radius_meters))
+
+    async def _fetch_visual_mask(self, lat, lng, radius_meters):
+        params = {
+            "location.latitude": lat,
+            "location.longitude": lng,
+            "radiusMeters": radius_meters,
+            "view": "FULL_LAYERS",
+            "requiredQuality": "HIGH",
+            "key": self.api_key
+        }
+        try:
+            return self._build_visual_layers(await self._get_json("/dataLayers:get", params))
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    async def get_many(self, locations, quality="HIGH"):
+        """
+        Bulk building insights for batch quoting jobs.
+        locations: iterable of (lat, lng) pairs.
+        Returns results in the same order; failures are per-location error dicts.
+        """
+        return await asyncio.gather(*[self.get_roof_geometry(lat, lng, quality) for lat, lng in locations])
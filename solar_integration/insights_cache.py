@@ -0,0 +1,178 @@
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Same cache directory as the segmentation service when it is importable
+# (repo root on sys.path); otherwise a cache/ folder next to this module
+try:
+    from roof_segmentation.config import CACHE_DIR
+    from roof_segmentation.result_cache import cache_path
+except ImportError:
+    CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+    def cache_path(cache_dir, path):
+        return os.path.join(cache_dir, path) if path else None
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(lat, lng, precision=9):
+    """
+    Standard geohash of (lat, lng). Precision 9 is a ~4.8m x 4.8m cell,
+    small enough that one cell never spans two separate buildings' click areas.
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True # Even bits encode longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+class InsightsCache:
+    """
+    Persistent cache of Google Solar buildingInsights answers keyed on
+    (geohash(lat, lng, precision), quality).
+    Stores the raw JSON and the processed metrics in sqlite with a TTL, caches
+    404 "Building not found" answers for negative_ttl_seconds, and keeps a small
+    in-memory LRU in front so repeat clicks resolve without touching disk.
+    db_path is resolved under cache_dir unless absolute. Results are kept as
+    JSON, so every get() returns a fresh copy.
+    """
+    def __init__(self, db_path="solar_insights.sqlite", precision=9, ttl_seconds=90 * 24 * 3600,
+                 negative_ttl_seconds=7 * 24 * 3600, memory_items=4096, cache_dir=CACHE_DIR):
+        self.db_path = cache_path(cache_dir, db_path)
+        self.precision = precision
+        self.ttl = ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
+        self.memory_items = memory_items
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+        # Opened on first use in each process (connections must not cross a fork)
+        self._db = None
+        self._db_pid = None
+
+    def _connection(self):
+        # Caller holds self._lock
+        if self._db_pid != os.getpid():
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS building_insights ("
+                "geohash TEXT, quality TEXT, raw_json TEXT, result_json TEXT, "
+                "negative INTEGER, created_at REAL, PRIMARY KEY (geohash, quality))"
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def key(self, lat, lng, quality):
+        return geohash_encode(lat, lng, self.precision), quality
+
+    def get(self, lat, lng, quality="HIGH"):
+        """
+        Returns the cached processed result for the location, or None on a miss.
+        """
+        key = self.key(lat, lng, quality)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._connection().execute(
+                    "SELECT result_json, negative, created_at FROM building_insights WHERE geohash=? AND quality=?", key
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], bool(row[1]), row[2])
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+
+            if entry is not None:
+                data, negative, created_at = entry
+                if now - created_at <= (self.negative_ttl if negative else self.ttl):
+                    self.stats["negative_hits" if negative else "hits"] += 1
+                    return json.loads(data)
+                self._memory.pop(key, None)
+
+            self.stats["misses"] += 1
+            return None
+
+    def get_raw(self, lat, lng, quality="HIGH"):
+        """
+        Raw buildingInsights JSON for the location (for reprocessing), or None
+        if it is missing or older than the TTL.
+        """
+        key = self.key(lat, lng, quality)
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT raw_json FROM building_insights WHERE geohash=? AND quality=? AND negative=0 AND created_at >= ?",
+                key + (time.time() - self.ttl,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, lat, lng, quality, raw, result):
+        self._store(self.key(lat, lng, quality), raw, result, negative=False)
+
+    def put_negative(self, lat, lng, quality, result):
+        self._store(self.key(lat, lng, quality), None, result, negative=True)
+
+    def _store(self, key, raw, result, negative):
+        now = time.time()
+        data = json.dumps(result)
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO building_insights VALUES (?, ?, ?, ?, ?, ?)",
+                key + (json.dumps(raw) if raw is not None else None, data, int(negative), now)
+            )
+            db.commit()
+            self._remember(key, (data, negative, now))
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "DELETE FROM building_insights WHERE (negative=0 AND created_at < ?) OR (negative=1 AND created_at < ?)",
+                (now - self.ttl, now - self.negative_ttl)
+            )
+            db.commit()
+            self._memory.clear()
@@ -9,14 +9,24 @@ class SolarAPIClient:
     Client for interacting with Google Solar API.
     Designed for Serverless execution (AWS Lambda / pure Python script).
     """
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url="https://solar.googleapis.com/v1", timeout=10, cache=None):
         self.api_key = api_key
-        self.base_url = "https://solar.googleapis.com/v1"
+        self.base_url = base_url
+        self.timeout = timeout
+        # Optional InsightsCache: repeat clicks on the same building skip the paid call
+        self.cache = cache
+        # Keep-alive session: reuses the TCP+TLS connection across calls
+        self.session = requests.Session()
 
     def get_roof_geometry(self, lat, lng, quality="HIGH"):
         """
         Fetches building insights and extracts vector geometry.
         """
+        if self.cache is not None:
+            cached = self.cache.get(lat, lng, quality)
+            if cached is not None:
+                return cached
+            
         url = f"{self.base_url}/buildingInsights:findClosest"
         params = {
             "location.latitude": lat,
@@ -26,72 +36,91 @@ class SolarAPIClient:
         }
 
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             data = response.json()
-            
-            # Extract Critical Data
-            if "solarPotential" not in data:
-                return {"error": "No solar potential data found for this location"}
-
-            solar_pot = data["solarPotential"]
-            
-            # 1. Parse Segments (The core 3D geometry)
-            segments = self._process_segments(solar_pot.get("roofSegmentStats", []))
-            
-            # 2. Extract Bounds & Center
-            bounding_box = solar_pot.get("boundingBox", {})
-            center = data.get("center", {})
-            
-            # 3. Calculate Precision 3D Area
-            # "areaMeters2" in wholeRoofStats is the 3D SURFACE AREA, not 2D footprint.
-            # This accounts for the slope (pitch) which increases material usage.
-            total_3d_area_sqft = solar_pot.get("wholeRoofStats", {}).get("areaMeters2", 0) * 10.7639
-            max_pitch = max([s["pitch"] for s in segments]) if segments else 0
-            
-            # 4. Sealing-Specific Logic (Zero-Failure)
-            # Liquid membrane needs to cover overlaps and vertical parapets (pretiles).
-            # Google Solar DOES NOT measure vertical parapet walls, only the "sky-facing" planes.
-            # We must estimate a "Parapet Factor" based on roof complexity (number of segments).
-            
-            # Complexity Heuristic: More segments = More valleys/hips/parapets
-            num_segments = len(segments)
-            complexity_factor = 1.0
-            if num_segments > 5: complexity_factor = 1.05 # +5% for complex roofs
-            if num_segments > 15: complexity_factor = 1.10 # +10% for very complex
-            
-            # Base Waste for Liquid Applied Membrane (Overlap/Roller absorption)
-            # Standard industry is 10-15%. We recommend 15% to be "Ultra Safe".
-            base_waste = 1.15 
-            recommended_waste_factor = base_waste * complexity_factor
-
-            estimated_material_area = total_3d_area_sqft * recommended_waste_factor
-
-            return {
-                "status": "success",
-                "metrics": {
-                    "geometric_surface_area_sqft": round(total_3d_area_sqft, 2),
-                    "max_pitch_degrees": max_pitch,
-                    "roof_segments_count": num_segments,
-                    "recommended_waste_factor": round(recommended_waste_factor, 2),
-                    "estimated_material_needed_sqft": round(estimated_material_area, 2)
-                },
-                "segments": segments,
-                "bounding_box": bounding_box,
-                "center": center,
-                "note": "Area represents 3D surface including slope. Waste factor adds buffer for parapets and overlap."
-            }
+            result = self._build_geometry(data)
+            if self.cache is not None:
+                self.cache.put(lat, lng, quality, data, result)
+            return result
 
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                return {"status": "error", "message": "Building not found at this location."}
-            elif e.response.status_code == 403:
-                return {"status": "error", "message": "API Key Invalid or Quota Exceeded."}
-            else:
-                return {"status": "error", "message": str(e)}
+            return self._cache_http_error(lat, lng, quality, e.response.status_code, str(e))
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    def _cache_http_error(self, lat, lng, quality, status_code, message):
+        result = self._http_error(status_code, message)
+        # Negative caching: "Building not found" will not change for a while
+        if status_code == 404 and self.cache is not None:
+            self.cache.put_negative(lat, lng, quality, result)
+        return result
+
+    @staticmethod
+    def _http_error(status_code, message):
+        if status_code == 404:
+            return {"status": "error", "message": "Building not found at this location."}
+        elif status_code == 403:
+            return {"status": "error", "message": "API Key Invalid or Quota Exceeded."}
+        else:
+            return {"status": "error", "message": message}
+
+    def _build_geometry(self, data):
+        """
+        Turns a raw buildingInsights response into sealing metrics.
+        """
+        # Extract Critical Data
+        if "solarPotential" not in data:
+            return {"error": "No solar potential data found for this location"}
+
+        solar_pot = data["solarPotential"]
+        
+        # 1. Parse Segments (The core 3D geometry)
+        segments = self._process_segments(solar_pot.get("roofSegmentStats", []))
+        
+        # 2. Extract Bounds & Center
+        bounding_box = solar_pot.get("boundingBox", {})
+        center = data.get("center", {})
+        
+        # 3. Calculate Precision 3D Area
+        # "areaMeters2" in wholeRoofStats is the 3D SURFACE AREA, not 2D footprint.
+        # This accounts for the slope (pitch) which increases material usage.
+        total_3d_area_sqft = solar_pot.get("wholeRoofStats", {}).get("areaMeters2", 0) * 10.7639
+        max_pitch = max([s["pitch"] for s in segments]) if segments else 0
+        
+        # 4. Sealing-Specific Logic (Zero-Failure)
+        # Liquid membrane needs to cover overlaps and vertical parapets (pretiles).
+        # Google Solar DOES NOT measure vertical parapet walls, only the "sky-facing" planes.
+        # We must estimate a "Parapet Factor" based on roof complexity (number of segments).
+        
+        # Complexity Heuristic: More segments = More valleys/hips/parapets
+        num_segments = len(segments)
+        complexity_factor = 1.0
+        if num_segments > 5: complexity_factor = 1.05 # +5% for complex roofs
+        if num_segments > 15: complexity_factor = 1.10 # +10% for very complex
+        
+        # Base Waste for Liquid Applied Membrane (Overlap/Roller absorption)
+        # Standard industry is 10-15%. We recommend 15% to be "Ultra Safe".
+        base_waste = 1.15 
+        recommended_waste_factor = base_waste * complexity_factor
+
+        estimated_material_area = total_3d_area_sqft * recommended_waste_factor
+
+        return {
+            "status": "success",
+            "metrics": {
+                "geometric_surface_area_sqft": round(total_3d_area_sqft, 2),
+                "max_pitch_degrees": max_pitch,
+                "roof_segments_count": num_segments,
+                "recommended_waste_factor": round(recommended_waste_factor, 2),
+                "estimated_material_needed_sqft": round(estimated_material_area, 2)
+            },
+            "segments": segments,
+            "bounding_box": bounding_box,
+            "center": center,
+            "note": "Area represents 3D surface including slope. Waste factor adds buffer for parapets and overlap."
+        }
+
     def _process_segments(self, raw_stats):
         """
         Aggregates roof segments based on pitch and azimuth.
@@ -124,33 +153,31 @@ class SolarAPIClient:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
-            data = response.json()
-            
-            # Find Flux Layer or Mask Layer
-            # We look for 'rgbUrl' if available, otherwise 'maskUrl'
-            # The prompt asks for "image_overlay_url"
-            
-            if "imageryLayers" in data:
-                # Prioritize RGB
-                for layer in data["imageryLayers"]:
-                     if "rgb" in layer: # Simplification, check API spec for exact key
-                         pass 
-                # Actually Solar API returns 'rgbUrl', 'maskUrl', 'dsmUrl', 'annualFluxUrl'
-                
-            # For simplicity, returning the Annual Flux URL which is most common for visualization
-            return {
-                "status": "success",
-                "annual_flux_url": data.get("annualFluxUrl"),
-                "mask_url": data.get("maskUrl"),
-                "dsm_url": data.get("dsmUrl"),
-                "rgb_url": data.get("rgbUrl")
-            }
+            return self._build_visual_layers(response.json())
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    def _build_visual_layers(self, data):
+        """
+        Picks the overlay URLs out of a raw dataLayers response.
+        """
+        # Find Flux Layer or Mask Layer
+        # We look for 'rgbUrl' if available, otherwise 'maskUrl'
+        # The prompt asks for "image_overlay_url"
+        # Solar API returns 'rgbUrl', 'maskUrl', 'dsmUrl', 'annualFluxUrl'
+            
+        # For simplicity, returning the Annual Flux URL which is most common for visualization
+        return {
+            "status": "success",
+            "annual_flux_url": data.get("annualFluxUrl"),
+            "mask_url": data.get("maskUrl"),
+            "dsm_url": data.get("dsmUrl"),
+            "rgb_url": data.get("rgbUrl")
+        }
+
 # --- Execution Entry Point (Simulation) ---
 if __name__ == "__main__":
     # Load API Key from Env or Hardcoded (User needs to supply)
@@ -0,0 +1,6 @@
+
+import os
+import sys
+
+# Tests import the package as roof_segmentation.<module>, like serve.py / api.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
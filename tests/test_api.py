@@ -0,0 +1,17 @@
+
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+from roof_segmentation import api
+
+
+def test_predict_rejects_unknown_mode_before_inference():
+    ok, png = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))
+    # No `with`: the startup hook (model load) does not run, so a 400 must come first
+    client = TestClient(api.app)
+    resp = client.post("/predict", params={"mode": "bogus"}, files={"file": ("a.png", png.tobytes())})
+
+    assert resp.status_code == 400
+    assert "mode" in resp.json()["error"]
+    assert api.predict_cache.stats()["misses"] == 0
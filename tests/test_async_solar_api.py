@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+
+from solar_integration.async_solar_api import AsyncSolarAPIClient
+from solar_integration.insights_cache import InsightsCache
+
+BUILDING = {
+    "center": {"latitude": 40.4168, "longitude": -3.7038},
+    "solarPotential": {
+        "wholeRoofStats": {"areaMeters2": 100.0},
+        "roofSegmentStats": [{"pitchDegrees": 20.0, "azimuthDegrees": 180.0, "stats": {"areaMeters2": 100.0}}],
+    },
+}
+
+
+class StubSolarAPI:
+    """
+    httpx.MockTransport handler: answers buildingInsights after a short delay
+    (so concurrent lookups overlap) and records every upstream request.
+    """
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(0.05)
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, json={"error": {"code": self.status_code}})
+        return httpx.Response(200, json=BUILDING)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_identical_lookups_share_one_request():
+    stub = StubSolarAPI()
+
+    async def scenario():
+        async with AsyncSolarAPIClient("key", transport=httpx.MockTransport(stub)) as client:
+            return await asyncio.gather(*[client.get_roof_geometry(40.4168, -3.7038) for _ in range(10)])
+
+    results = run(scenario())
+    assert len(stub.requests) == 1
+    assert stub.requests[0].url.path.endswith("/buildingInsights:findClosest")
+    assert all(r["status"] == "success" for r in results)
+    assert results[0]["metrics"]["roof_segments_count"] == 1
+
+
+def test_cache_hit_skips_the_upstream_call(tmp_path):
+    stub = StubSolarAPI()
+    cache = InsightsCache(cache_dir=str(tmp_path))
+
+    async def scenario():
+        async with AsyncSolarAPIClient("key", transport=httpx.MockTransport(stub), cache=cache) as client:
+            first = await client.get_roof_geometry(40.416775, -3.703790)
+            # Different click, same geohash cell
+            second = await client.get_roof_geometry(40.416780, -3.703795)
+            return first, second
+
+    first, second = run(scenario())
+    assert len(stub.requests) == 1
+    assert first == second
+    assert cache.stats["hits"] == 1
+    assert cache.get_raw(40.416775, -3.703790) == BUILDING
+
+
+def test_not_found_is_cached_negatively(tmp_path):
+    stub = StubSolarAPI(status_code=404)
+    cache = InsightsCache(cache_dir=str(tmp_path))
+
+    async def scenario():
+        async with AsyncSolarAPIClient("key", transport=httpx.MockTransport(stub), cache=cache) as client:
+            return [await client.get_roof_geometry(1.0, 2.0) for _ in range(2)]
+
+    results = run(scenario())
+    assert len(stub.requests) == 1
+    assert results[0] == results[1]
+    assert "not found" in results[0]["message"]
+    assert cache.stats["negative_hits"] == 1
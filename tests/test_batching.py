@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+import torch
+
+from roof_segmentation.batching import InferenceBatcher
+
+
+class GatedModel(torch.nn.Module):
+    """
+    Identity model whose forward pass waits for `gate`, so the test controls
+    when the batcher's worker is busy.
+    """
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.batches = []
+
+    def forward(self, x):
+        self.started.set()
+        self.gate.wait(5)
+        self.batches.append(x.shape[0])
+        return x[:, :1]
+
+
+def test_cancelled_request_does_not_kill_the_worker():
+    model = GatedModel()
+    batcher = InferenceBatcher(model, torch.device("cpu"), max_batch_size=1, max_wait_ms=1)
+
+    async def scenario():
+        # 1. Cancelled while its batch is running: it still completes on the worker
+        running = asyncio.ensure_future(batcher.predict_async(torch.zeros(1, 4, 4)))
+        await asyncio.to_thread(model.started.wait, 5)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.shield(running), 0.05)
+        running.cancel()
+
+        # 2. Cancelled while still queued: skipped, never reaches the model
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(batcher.predict_async(torch.zeros(1, 4, 4)), 0.05)
+
+        model.gate.set()
+        # 3. The worker is still alive for the next request
+        return await asyncio.wait_for(batcher.predict_async(torch.ones(1, 4, 4)), 5)
+
+    prob_map = asyncio.run(scenario())
+    assert prob_map.shape == (4, 4)
+    assert prob_map.min() > 0.5 # sigmoid(1)
+    assert batcher._worker.is_alive()
+    assert model.batches == [1, 1]
+
+
+def test_failed_batch_sets_the_exception_and_keeps_serving():
+    class Flaky(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def forward(self, x):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("boom")
+            return x[:, :1]
+
+    batcher = InferenceBatcher(Flaky(), torch.device("cpu"), max_batch_size=1, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="boom"):
+        batcher.predict(torch.zeros(1, 4, 4))
+    assert batcher.predict(torch.zeros(1, 4, 4)).shape == (4, 4)
@@ -0,0 +1,38 @@
+import random
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from roof_segmentation.checkpointing import restore_rng_state, rng_state
+
+
+class RandomDraws(Dataset):
+    """
+    Stands in for an augmented dataset: each sample is the index plus a value
+    drawn from the worker's `random` module (like RoofAugment).
+    """
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, idx):
+        return idx, random.random()
+
+
+def epoch(loader):
+    return [(int(i), float(v)) for idx, draws in loader for i, v in zip(idx, draws)]
+
+
+def test_loader_generator_state_replays_the_next_epoch():
+    generator = torch.Generator().manual_seed(0)
+    loader = DataLoader(RandomDraws(), batch_size=2, shuffle=True, num_workers=2, generator=generator)
+    epoch(loader)
+
+    state = rng_state(generator)
+    expected = epoch(loader)
+    epoch(loader)
+
+    # Fresh generator, as after a restart
+    resumed = torch.Generator().manual_seed(0)
+    restore_rng_state(state, resumed)
+    loader = DataLoader(RandomDraws(), batch_size=2, shuffle=True, num_workers=2, generator=resumed)
+    assert epoch(loader) == expected
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from solar_integration.insights_cache import InsightsCache, geohash_encode
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_geohash_keying():
+    # Reference value from the geohash spec's worked example
+    assert geohash_encode(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    cache = InsightsCache(cache_dir="unused", precision=9)
+    # ~1 m apart: same cell, same key; ~50 m apart: different cells
+    assert cache.key(40.416775, -3.703790, "HIGH") == cache.key(40.416780, -3.703795, "HIGH")
+    assert cache.key(40.416775, -3.703790, "HIGH") != cache.key(40.417225, -3.703790, "HIGH")
+    assert cache.key(40.416775, -3.703790, "HIGH") != cache.key(40.416775, -3.703790, "MEDIUM")
+
+
+def test_nearby_click_hits_and_results_are_copies(tmp_path):
+    cache = InsightsCache(cache_dir=str(tmp_path))
+    cache.put(40.416775, -3.703790, "HIGH", {"raw": 1}, {"area": 10})
+
+    result = cache.get(40.416780, -3.703795)
+    assert result == {"area": 10}
+    result["area"] = 0
+    assert cache.get(40.416775, -3.703790) == {"area": 10}
+    assert cache.stats["hits"] == 2
+    assert (tmp_path / "solar_insights.sqlite").exists()
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = InsightsCache(cache_dir=str(tmp_path), ttl_seconds=100)
+    cache.put(1.0, 2.0, "HIGH", {"raw": 1}, {"area": 10})
+
+    clock[0] += 99
+    assert cache.get(1.0, 2.0) == {"area": 10}
+    assert cache.get_raw(1.0, 2.0) == {"raw": 1}
+
+    clock[0] += 2
+    assert cache.get(1.0, 2.0) is None
+    assert cache.get_raw(1.0, 2.0) is None
+    assert cache.stats["misses"] == 1
+
+
+def test_negative_entries(tmp_path, clock):
+    cache = InsightsCache(cache_dir=str(tmp_path), ttl_seconds=1000, negative_ttl_seconds=10)
+    cache.put_negative(1.0, 2.0, "HIGH", {"status": "error", "message": "Building not found"})
+
+    assert cache.get(1.0, 2.0)["message"] == "Building not found"
+    assert cache.stats["negative_hits"] == 1
+    # No raw answer to reprocess
+    assert cache.get_raw(1.0, 2.0) is None
+
+    # Negative answers expire on their own, shorter TTL
+    clock[0] += 11
+    assert cache.get(1.0, 2.0) is None
+
+
+def test_reopen_from_disk(tmp_path):
+    InsightsCache(cache_dir=str(tmp_path)).put(1.0, 2.0, "HIGH", {"raw": 1}, {"area": 10})
+
+    reopened = InsightsCache(cache_dir=str(tmp_path))
+    assert reopened.get(1.0, 2.0) == {"area": 10}
+    assert reopened.get_raw(1.0, 2.0) == {"raw": 1}
+    assert reopened.stats["hits"] == 1
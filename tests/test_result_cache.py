@@ -0,0 +1,67 @@
+
+import os
+import asyncio
+import threading
+
+from roof_segmentation import config
+from roof_segmentation import model_registry
+from roof_segmentation.result_cache import ResultCache
+
+
+def test_caches_sharing_a_file_do_not_wipe_each_other(tmp_path):
+    db_path = str(tmp_path / "results.sqlite")
+    fingerprints = {"a": "ckpt-1", "b": "ckpt-1"}
+    a = ResultCache("predict", lambda: fingerprints["a"], db_path=db_path)
+    b = ResultCache("predict", lambda: fingerprints["b"], db_path=db_path)
+
+    a.put(a.key("img"), {"area": 1})
+    assert b.get(b.key("img")) == {"area": 1}
+    assert b.stats()["disk_hits"] == 1
+
+    # b moves to a new checkpoint: it stops seeing old rows, a keeps them
+    fingerprints["b"] = "ckpt-2"
+    assert b.get(b.key("img")) is None
+    assert b.stats()["invalidations"] == 1
+    a._memory.clear()
+    assert a.get(a.key("img")) == {"area": 1}
+
+
+def test_model_fingerprint_does_not_change_when_the_model_loads(tmp_path, monkeypatch):
+    checkpoint = tmp_path / "best_model.pth"
+    checkpoint.write_bytes(b"weights-1")
+    monkeypatch.setattr(config, "BEST_MODEL_PATH", str(checkpoint))
+    monkeypatch.setattr(model_registry, "_fingerprints", {})
+    key = model_registry.model_key("eager", False, False)
+
+    before = model_registry.model_fingerprint("eager", False, False)
+    # What get_model records when it loads the checkpoint
+    model_registry._fingerprints[key] = model_registry.source_fingerprint("eager")
+    assert model_registry.model_fingerprint("eager", False, False) == before
+
+    # Checkpoint replaced while the old weights are still loaded
+    checkpoint.write_bytes(b"weights-2, a different size")
+    os.utime(checkpoint, ns=(1, 1))
+    stale = model_registry.model_fingerprint("eager", False, False)
+    assert stale != before
+    assert "stale:" in stale
+
+    # After a restart with the new weights
+    model_registry._fingerprints[key] = model_registry.source_fingerprint("eager")
+    current = model_registry.model_fingerprint("eager", False, False)
+    assert current not in (before, stale)
+    assert "stale:" not in current
+
+
+def test_async_access_runs_sqlite_off_the_event_loop(tmp_path):
+    cache = ResultCache("predict", lambda: "ckpt-1", db_path=str(tmp_path / "results.sqlite"))
+    threads = []
+    get = cache.get
+    cache.get = lambda key: threads.append(threading.get_ident()) or get(key)
+
+    async def scenario():
+        await cache.aput(cache.key("img"), {"area": 1})
+        return await cache.aget(cache.key("img")), threading.get_ident()
+
+    result, loop_thread = asyncio.run(scenario())
+    assert result == {"area": 1}
+    assert threads and loop_thread not in threads
@@ -0,0 +1,23 @@
+import pytest
+import torch
+
+from roof_segmentation import config
+from roof_segmentation import model_registry
+from roof_segmentation.runtime import load_model
+
+
+@pytest.mark.parametrize("runtime, setting", [("torchscript", "TORCHSCRIPT_MODEL_PATH"), ("int8", "INT8_MODEL_PATH"),
+                                              ("onnx", "ONNX_MODEL_PATH")])
+def test_missing_artifact_fails_instead_of_serving_eager(tmp_path, monkeypatch, runtime, setting):
+    monkeypatch.setattr(config, setting, str(tmp_path / "missing"))
+    with pytest.raises(FileNotFoundError, match=f"--formats {runtime}"):
+        load_model(runtime, torch.device("cpu"))
+
+
+def test_registry_does_not_record_a_failed_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INT8_MODEL_PATH", str(tmp_path / "missing"))
+    key = model_registry.model_key("int8")
+    with pytest.raises(FileNotFoundError):
+        model_registry.get_model("int8")
+    assert key not in model_registry._models
+    assert key not in model_registry._fingerprints
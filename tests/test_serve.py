@@ -0,0 +1,45 @@
+import signal
+import sys
+
+import pytest
+import torch
+
+from roof_segmentation import config
+from roof_segmentation import serve
+
+
+@pytest.fixture
+def serve_args(monkeypatch):
+    # main() installs SIGTERM / SIGINT handlers; put pytest's back afterwards
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    monkeypatch.setattr(sys, "argv", ["serve", "--workers", "1", "--host", "127.0.0.1", "--port", "0"])
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def test_worker_failing_at_startup_stops_the_server(serve_args, monkeypatch):
+    monkeypatch.setattr(config, "SERVE_RESTART_DELAY", 0.01)
+    monkeypatch.setattr(config, "SERVE_MAX_STARTUP_FAILURES", 3)
+    monkeypatch.setattr(serve, "load_shared_model", lambda: (None, torch.device("cpu")))
+
+    def broken_worker(index, sock, readiness, threads):
+        raise RuntimeError("bad checkpoint") # Runs in the forked child, which exits 1
+
+    monkeypatch.setattr(serve, "run_worker", broken_worker)
+    spawned = []
+    spawn_worker = serve.spawn_worker
+    monkeypatch.setattr(serve, "spawn_worker", lambda *a: spawned.append(a[0]) or spawn_worker(*a))
+
+    with pytest.raises(SystemExit) as exc:
+        serve.main()
+    assert exc.value.code == 1
+    assert spawned == [0, 0, 0]
+
+
+def test_refuses_to_fork_a_cuda_model(serve_args, monkeypatch):
+    monkeypatch.setattr(serve, "load_shared_model", lambda: (None, torch.device("cuda")))
+    monkeypatch.setattr(serve, "spawn_worker", lambda *a: pytest.fail("forked a CUDA model"))
+
+    with pytest.raises(SystemExit, match="CUDA"):
+        serve.main()
@@ -0,0 +1,167 @@
+
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2
+import numpy as np
+import pytest
+
+from roof_segmentation import config
+from roof_segmentation import utils
+from roof_segmentation.tile_cache import TileCache
+
+
+class FakeTileServer:
+    """
+    Local XYZ tile server: /{z}/{y}/{x} returns a small noise PNG (about the
+    same size for every tile) after `delay` seconds, and counts requests.
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                time.sleep(server.delay)
+                z, y, x = (int(v) for v in self.path.strip("/").split("/"))
+                rng = np.random.default_rng(x * 1000 + y)
+                ok, data = cv2.imencode(".png", rng.integers(0, 256, (32, 32, 3), dtype=np.uint8))
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data.tobytes())
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}" + "/{z}/{y}/{x}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def tile_server(monkeypatch):
+    server = FakeTileServer()
+    monkeypatch.setattr(config, "TILE_URL_TEMPLATE", server.url)
+    yield server
+    server.close()
+
+
+def make_cache(tmp_path, **kwargs):
+    return TileCache(utils.download_tile, db_path=str(tmp_path / "tiles.sqlite"), **kwargs)
+
+
+def stored_tiles(tmp_path):
+    with sqlite3.connect(str(tmp_path / "tiles.sqlite")) as db:
+        return sorted(db.execute("SELECT zoom_level, tile_column, tile_row FROM tiles").fetchall())
+
+
+def test_memory_hit_skips_network(tile_server, tmp_path):
+    cache = make_cache(tmp_path)
+    first = cache.get(20, 1, 2)
+    second = cache.get(20, 1, 2)
+
+    assert first is second
+    assert first.shape == (32, 32, 3)
+    assert len(tile_server.requests) == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_disk_hit_after_restart(tile_server, tmp_path):
+    first = make_cache(tmp_path).get(20, 1, 2)
+    # New process / memory tier: served from sqlite, not the server
+    cache = make_cache(tmp_path)
+    second = cache.get(20, 1, 2)
+
+    assert np.array_equal(first, second)
+    assert len(tile_server.requests) == 1
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_concurrent_misses_are_coalesced(tile_server, tmp_path):
+    tile_server.delay = 0.2
+    cache = make_cache(tmp_path)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        tiles = list(pool.map(lambda _: cache.get(20, 5, 5), range(8)))
+
+    assert all(tile is tiles[0] for tile in tiles)
+    assert len(tile_server.requests) == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["coalesced"] + cache.stats["memory_hits"] == 7
+
+
+def test_expired_disk_tile_is_downloaded_again(tile_server, tmp_path):
+    cache = make_cache(tmp_path, memory_items=0, ttl_seconds=0.05)
+    cache.get(20, 1, 2)
+    time.sleep(0.1)
+    cache.get(20, 1, 2)
+
+    assert len(tile_server.requests) == 2
+    assert cache.stats["disk_hits"] == 0
+    assert cache.stats["misses"] == 2
+
+
+def test_disk_tier_evicts_least_recently_accessed(tile_server, tmp_path):
+    tile_bytes = len(utils.download_tile(20, 0, 0))
+    tile_server.requests.clear()
+    # Room for two tiles, not three
+    cache = make_cache(tmp_path, memory_items=0, max_disk_bytes=int(2.5 * tile_bytes))
+    cache.get(20, 1, 1)
+    time.sleep(0.01)
+    cache.get(20, 2, 2)
+    time.sleep(0.01)
+    cache.get(20, 1, 1) # Disk hit: (1, 1) is now more recent than (2, 2)
+    time.sleep(0.01)
+    cache.get(20, 3, 3)
+
+    assert stored_tiles(tmp_path) == [(20, 1, 1), (20, 3, 3)]
+    assert len(tile_server.requests) == 3
+
+
+def test_utils_cache_is_created_lazily_under_cache_dir(tile_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(utils, "_tile_cache", None)
+
+    assert not os.path.exists(tmp_path / "cache")
+    img, bbox = utils.fetch_satellite_tile(18.4655, -66.1057)
+
+    assert img is not None
+    assert os.path.exists(tmp_path / "cache" / config.TILE_CACHE_PATH)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_opens_its_own_connection(tile_server, tmp_path):
+    cache = make_cache(tmp_path, memory_items=0)
+    cache.get(20, 1, 2)
+    parent_db = cache._db
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: disk hit through a fresh connection, not the inherited one
+        code = 1
+        try:
+            img = cache.get(20, 1, 2)
+            if img is not None and cache._db is not parent_db and cache.stats["disk_hits"] == 1:
+                code = 0
+        finally:
+            os.write(write, bytes([code]))
+            os._exit(code)
+    os.close(write)
+    result = os.read(read, 1)
+    os.waitpid(pid, 0)
+
+    assert result == bytes([0])
+    assert cache._db is parent_db
@@ -0,0 +1,45 @@
+import torch
+
+from roof_segmentation import config
+from roof_segmentation import train
+from roof_segmentation.loss import FusedFocalLoss
+from roof_segmentation.model import DeepLabV3Plus
+
+
+def test_bf16_amp_accumulation_channels_last_steps(monkeypatch):
+    # One config module: the monkeypatched settings are the ones train.py reads
+    assert train.config is config
+    monkeypatch.setattr(config, "AMP_ENABLED", True)
+    monkeypatch.setattr(config, "AMP_DTYPE", "bfloat16")
+    monkeypatch.setattr(config, "GRAD_ACCUM_STEPS", 2)
+    monkeypatch.setattr(config, "CHANNELS_LAST", True)
+    torch.manual_seed(0)
+
+    device = torch.device("cpu")
+    model = DeepLabV3Plus(n_classes=1, backbone="resnet18", output_stride=16, pretrained=False)
+    model = model.to(memory_format=torch.channels_last)
+    model.train()
+    criterion = FusedFocalLoss(alpha=config.LOSS_ALPHA, gamma=config.LOSS_GAMMA)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    amp_dtype = train.resolve_amp_dtype(device)
+    scaler = torch.amp.GradScaler(device.type, enabled=amp_dtype == torch.float16)
+    assert amp_dtype == torch.bfloat16 and not scaler.is_enabled()
+
+    before = [p.detach().clone() for p in model.parameters()]
+    batches = [(torch.rand(2, 3, 64, 64).contiguous(memory_format=torch.channels_last),
+                (torch.rand(2, 64, 64) > 0.5).long()) for _ in range(config.GRAD_ACCUM_STEPS)]
+
+    # 1. First batch only accumulates gradients
+    loss = train.train_step(model, *batches[0], criterion, optimizer, scaler, amp_dtype, sync_step=False,
+                            accum_steps=config.GRAD_ACCUM_STEPS)
+    assert torch.isfinite(loss)
+    assert all(torch.equal(p, b) for p, b in zip(model.parameters(), before))
+    assert any(p.grad is not None and p.grad.abs().sum() > 0 for p in model.parameters())
+
+    # 2. Second batch closes the window: optimizer steps, gradients are cleared
+    loss = train.train_step(model, *batches[1], criterion, optimizer, scaler, amp_dtype, sync_step=True,
+                            accum_steps=config.GRAD_ACCUM_STEPS)
+    assert torch.isfinite(loss)
+    assert any(not torch.equal(p, b) for p, b in zip(model.parameters(), before))
+    assert all(torch.isfinite(p).all() for p in model.parameters())
+    assert all(p.grad is None for p in model.parameters())